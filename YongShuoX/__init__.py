@@ -1,10 +1,35 @@
-from .node import YS, YSNodeType, YSNode, YSQuerySet, YSMainFolder, YSFolder, YSEntranceLocker, \
-    YSAuthRights, YSFolderRights, YSComment, YSIdNode, YSFriendLink, YSLink, YSText, YSFile, \
-    YSAdminLocker, YSFolderLocker, YSLocker
+import importlib
+
+# 按需导入：访问导出名时才加载对应模块，避免 import YongShuoX 时加载 bs4/requests 等重量级依赖
+_exports = dict(
+    YS='node', YSMainFolder='node', YSFolder='node', YSLink='node', YSText='node', YSFile='node',
+    YSNodeType='modules', YSNode='modules', YSQuerySet='modules', YSComment='modules',
+    YSIdNode='modules', YSFriendLink='modules',
+    YSEntranceLocker='locker', YSAdminLocker='locker', YSFolderLocker='locker', YSLocker='locker',
+    YSAuthRights='rights', YSFolderRights='rights',
+    YSMirror='mirror', YSMirrorReport='mirror',
+    YSNodeStore='store', YSCassette='cassette', YSDownloadCache='cache', YSPool='pool',
+    Transport='base', YSDeadline='base', YSTracer='base', YSSpan='base', tracer='base',
+)
+
+
+def __getattr__(name):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_exports))
 
 
 __all__ = [
-    YS, YSNodeType, YSNode, YSQuerySet, YSMainFolder, YSFolder, YSEntranceLocker,
-    YSAuthRights, YSFolderRights, YSComment, YSIdNode, YSFriendLink, YSLink, YSText, YSFile,
-    YSAdminLocker, YSFolderLocker, YSLocker
+    'YS', 'YSNodeType', 'YSNode', 'YSQuerySet', 'YSMainFolder', 'YSFolder', 'YSEntranceLocker',
+    'YSAuthRights', 'YSFolderRights', 'YSComment', 'YSIdNode', 'YSFriendLink', 'YSLink', 'YSText',
+    'YSFile', 'YSAdminLocker', 'YSFolderLocker', 'YSLocker', 'YSMirror', 'YSMirrorReport', 'YSPool',
+    'YSNodeStore', 'YSCassette', 'YSDownloadCache', 'Transport', 'YSDeadline', 'YSTracer', 'YSSpan',
+    'tracer',
 ]
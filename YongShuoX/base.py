@@ -1,8 +1,16 @@
+import functools
+import itertools
 import json
-from typing import Callable
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional
+from urllib.parse import urlsplit
 
-import requests
-from bs4 import BeautifulSoup as Souper
 from smartify import E
 
 
@@ -11,12 +19,10 @@ class YSError:
     NOT_IMPLEMENTED = E("功能没有实现")
 
 
-class _Log:
-    """日志记录"""
-    records = []
-
-    def __init__(self, text):
-        _Log.records.append(text)
+@E.register()
+class DeadlineError:
+    EXPIRED = E("操作超时")
+    CANCELLED = E("操作已取消")
 
 
 class _Symbol:
@@ -48,28 +54,900 @@ class _Dictifier:
         return dict_
 
 
-class Fetcher:
+class _NullSpan:
+    """关闭追踪或未被采样时使用的空跨度"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        return self
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _SkippedSpan(_NullSpan):
+    """未被采样的根跨度，占住栈顶使其子跨度一并跳过"""
+
+    def __init__(self, tracer: 'YSTracer'):
+        self.tracer = tracer
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+
+    def __exit__(self, *exc):
+        self.tracer._stack().pop()
+        return False
+
+
+class YSSpan(_Dictifier):
+    """追踪跨度"""
+
+    def __init__(self, tracer: 'YSTracer', name, trace_id, parent_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = next(tracer._ids)
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = None  # 开始时间戳
+        self.duration = None  # 耗时，单位为秒
+        self.error = None
+        self._clock = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+        self.start = time.time()
+        self._clock = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._clock
+        if exc is not None:
+            self.error = repr(exc)
+        self.tracer._stack().pop()
+        self.tracer._finish(self)
+        return False
+
+    def d(self):
+        return self.dictify(
+            'name', 'trace_id', 'span_id', 'parent_id', 'start', 'duration', 'error', 'attrs')
+
+
+class YSTracer:
+    """结构化追踪，跨度保存在定长环形缓冲区中，关闭时几乎没有开销"""
+
+    def __init__(self, capacity=1024, sample_rate=1.0):
+        """
+        :param capacity: 环形缓冲区保留的跨度数
+        :param sample_rate: 根跨度的采样率，子跨度跟随根跨度
+        """
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.records = deque(maxlen=capacity)  # type: Deque[YSSpan]
+        self.hooks = []  # type: List[Callable[[YSSpan], None]]
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    def configure(self, enabled=None, capacity=None, sample_rate=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if capacity is not None:
+            self.records = deque(self.records, maxlen=capacity)
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        return self
+
+    def enable(self, sample_rate=None):
+        return self.configure(enabled=True, sample_rate=sample_rate)
+
+    def disable(self):
+        return self.configure(enabled=False)
+
+    def add_hook(self, hook: Callable):
+        """添加导出钩子，每个跨度结束时调用"""
+        self.hooks.append(hook)
+        return self
+
+    def remove_hook(self, hook: Callable):
+        self.hooks.remove(hook)
+        return self
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @property
+    def current(self) -> Optional[YSSpan]:
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def span(self, name, parent=None, **attrs):
+        """
+        新建跨度，作为上下文管理器使用
+        :param name: 跨度名称
+        :param parent: 父跨度，默认为当前线程的栈顶跨度
+        :param attrs: 附加属性
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+
+        parent = parent or self.current
+        if isinstance(parent, _SkippedSpan):
+            return _NULL_SPAN
+        if parent is None:
+            if self.sample_rate < 1 and random.random() >= self.sample_rate:
+                return _SkippedSpan(self)
+            return YSSpan(self, name, next(self._ids), None, attrs)
+        return YSSpan(self, name, parent.trace_id, parent.span_id, attrs)
+
+    def wrap(self, func: Callable):
+        """将当前跨度带入其他线程，使线程池中的跨度挂在调用方跨度下"""
+        parent = self.current if self.enabled else None
+        if parent is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = self._stack()
+            stack.append(parent)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stack.pop()
+        return wrapper
+
+    def _finish(self, span: YSSpan):
+        self.records.append(span)
+        for hook in list(self.hooks):
+            try:
+                hook(span)
+            except Exception:
+                pass
+
+    def clear(self):
+        self.records.clear()
+        return self
+
+
+tracer = YSTracer()
+
+
+def traced(name):
+    """方法追踪装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class YSDeadline:
+    """
+    截止时间与取消令牌，作为上下文管理器在当前线程生效，经Transport线程池带入工作线程
+    超时或取消后，尚未发出的请求直接放弃，进行中的请求以剩余时间为超时
+    """
+
+    _local = threading.local()
+
+    # 等待时重新检查取消状态的间隔秒数，只可取消不限时的令牌也不会一直阻塞
+    POLL_SECONDS = 0.1
+
+    def __init__(self, timeout=None, parent: 'YSDeadline' = None):
+        """
+        :param timeout: 剩余秒数，None表示只可取消不限时
+        :param parent: 外层令牌，外层取消或超时时本令牌同样失效，默认为当前线程生效的令牌
+        """
+        self.parent = parent if parent is not None else self.current()
+        self.expires = time.monotonic() + timeout if timeout is not None else None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def of(cls, deadline) -> Optional['YSDeadline']:
+        """将秒数或令牌统一为令牌"""
+        if deadline is None or isinstance(deadline, YSDeadline):
+            return deadline
+        return cls(deadline)
+
+    @classmethod
+    def _stack(cls) -> list:
+        stack = getattr(cls._local, 'stack', None)
+        if stack is None:
+            stack = cls._local.stack = []
+        return stack
+
+    @classmethod
+    def current(cls) -> Optional['YSDeadline']:
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @classmethod
+    def wrap(cls, func: Callable):
+        """将当前令牌带入其他线程"""
+        deadline = cls.current()
+        if deadline is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with deadline:
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self._stack().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self._stack().pop()
+        return False
+
+    def cancel(self):
+        self._cancelled.set()
+        return self
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，None表示不限时"""
+        remaining = None if self.expires is None else max(0.0, self.expires - time.monotonic())
+        if self.parent is not None:
+            outer = self.parent.remaining
+            if outer is not None:
+                remaining = outer if remaining is None else min(remaining, outer)
+        return remaining
+
+    @property
+    def expired(self):
+        return self.cancelled or self.remaining == 0
+
+    def check(self):
+        """取消或超时时抛出异常"""
+        if self.cancelled:
+            raise DeadlineError.CANCELLED
+        if self.remaining == 0:
+            raise DeadlineError.EXPIRED
+        return self
+
+    def timeout(self, default=None) -> Optional[float]:
+        """
+        以剩余时间约束超时时间
+        :param default: 原本的超时秒数
+        """
+        remaining = self.remaining
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    @classmethod
+    @contextmanager
+    def scope(cls, deadline=None):
+        """
+        在当前线程启用截止时间
+        :param deadline: 秒数或令牌，为空时沿用当前线程已有的令牌
+        """
+        deadline = cls.of(deadline)
+        if deadline is None:
+            yield cls.current()
+            return
+        with deadline:
+            yield deadline
+
+    def wait(self, waiter: Callable[[float], bool]):
+        """
+        分段等待直到waiter返回真，每段之间检查取消与超时，取消或超时时抛出异常
+        :param waiter: 接受超时秒数、返回是否等到的等待函数
+        """
+        while True:
+            self.check()
+            if waiter(self.timeout(self.POLL_SECONDS)):
+                return self
+
+    def sleep(self, seconds):
+        """在剩余时间内等待，取消时提前返回"""
+        self._cancelled.wait(self.timeout(seconds))
+        return self.check()
+
+
+def _wait_slot(acquire: Callable, deadline: Optional[YSDeadline]):
+    """在截止时间内等待名额"""
+    if deadline is None:
+        return acquire()
+    deadline.wait(lambda timeout: acquire(timeout=timeout))
+
+
+def scan(data, pattern: bytes) -> bool:
+    """在原始响应体中查找字节模式，无需解码"""
+    return re.search(pattern, data) is not None
+
+
+def scan_group(data, pattern: bytes, encoding='utf-8') -> Optional[str]:
+    """在原始响应体中提取字节模式的第一个分组并解码"""
+    matcher = re.search(pattern, data)
+    return bytes(matcher.group(1)).decode(encoding) if matcher else None
+
+
+class _LRUCache:
+    """有界LRU缓存"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _Flight:
     def __init__(self):
-        self.sess = requests.Session()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None  # type: Optional[BaseException]
+
+
+class SingleFlight:
+    """请求合并，相同键的并发调用只执行一次并共享结果"""
+
+    def __init__(self):
+        self._flights = dict()
+        self._lock = threading.Lock()
+
+    def do(self, key, func: Callable):
+        """
+        :param key: 逻辑请求键，应与口令等易变参数无关
+        :param func: 实际执行的调用
+        :return: 调用结果，跟随者与执行者得到同一对象
+        """
+        deadline = YSDeadline.current()
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+            if leader:
+                break
+
+            # 跟随者按自己的截止时间等待
+            if deadline:
+                deadline.wait(flight.done.wait)
+            else:
+                flight.done.wait()
+            error = flight.error
+            if error is None:
+                return flight.result
+            if getattr(error, 'class_', None) is DeadlineError \
+                    and not (deadline and deadline.expired):
+                # 执行者因自己的截止时间放弃，跟随者仍有剩余时间时重新发起
+                continue
+            raise error
+
+        try:
+            flight.result = func()
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+
+class _Outcome:
+    """单次请求的结果，用于反馈给自适应限制器"""
+
+    def __init__(self):
+        self.latency = None  # type: Optional[float]
+        self.ok = True
+
+    def observe(self, resp):
+        self.latency = resp.elapsed.total_seconds()
+        self.ok = resp.status_code < 500 and resp.status_code != 429
+
+
+class AdaptiveLimiter(_Dictifier):
+    """AIMD自适应并发限制器，成功时线性增加并发，出错或延迟升高时成倍减少"""
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, backoff=0.5, tolerance=2.0,
+                 smoothing=0.2):
+        """
+        :param initial: 初始并发数
+        :param min_limit: 并发下限
+        :param max_limit: 并发上限
+        :param backoff: 拥塞时的并发缩减系数
+        :param tolerance: 延迟超过基准延迟的倍数时视为拥塞
+        :param smoothing: 延迟指数平均的平滑系数
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency = None  # type: Optional[float] # 平滑后的延迟
+        self.base_latency = None  # type: Optional[float] # 基准延迟，缓慢跟随最低延迟
+
+        self._last_drop = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def concurrency(self):
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self, timeout=None):
+        """
+        :param timeout: 最长等待秒数，None表示一直等待
+        :return: 是否取得名额
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.inflight < self.concurrency, timeout):
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, latency, ok=True):
+        with self._cond:
+            self.inflight -= 1
+            self.requests += 1
+
+            if self.latency is None:
+                self.latency = self.base_latency = latency
+            else:
+                self.latency += (latency - self.latency) * self.smoothing
+                drift = (latency - self.base_latency) * 0.01
+                self.base_latency = min(latency, self.base_latency + drift)
+
+            congested = not ok or latency > self.base_latency * self.tolerance
+            if not ok:
+                self.errors += 1
+
+            now = time.monotonic()
+            if congested:
+                # 一个往返时间内最多下调一次，避免同一批失败连续下调
+                if now - self._last_drop > self.latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_drop = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, deadline: YSDeadline = None):
+        _wait_slot(self.acquire, deadline)
+        outcome = _Outcome()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            outcome.ok = False
+            raise
+        finally:
+            latency = outcome.latency if outcome.latency is not None else time.monotonic() - start
+            self.release(latency, outcome.ok)
+
+    def d(self):
+        return self.dictify(
+            'concurrency', 'limit', 'inflight', 'requests', 'errors', 'latency', 'base_latency')
+
+
+class Transport:
+    """传输层，可在多个Fetcher之间共享连接池、线程池、全局并发上限与各主机的自适应限制器"""
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, workers=4, max_requests=None,
+                 adaptive=True, initial_limit=4, max_limit=None):
+        """
+        :param pool_connections: 缓存的主机连接池数量
+        :param pool_maxsize: 每个主机的最大连接数
+        :param workers: 线程池大小
+        :param max_requests: 全局同时进行的请求数上限，None表示不限制
+        :param adaptive: 是否按主机自适应调整并发
+        :param initial_limit: 每个主机的初始并发数
+        :param max_limit: 每个主机的并发上限，默认为每个主机的最大连接数
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.workers = workers
+        self.max_requests = max_requests
+        self._limit = threading.BoundedSemaphore(max_requests) if max_requests else None
+
+        self.adaptive = adaptive
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit or pool_maxsize
+        self._limiters = dict()  # type: Dict[str, AdaptiveLimiter]
+
+        self._adapter = None
+        self._executor = None
+        self._crawler = None
+        self._hedger = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def adapter(self):
+        """首次使用时才建立连接池"""
+        with self._lock:
+            if self._adapter is None:
+                from requests.adapters import HTTPAdapter
+                self._adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+            return self._adapter
+
+    def _mark(self, role):
+        """线程池初始化函数，记录当前线程所属的线程池"""
+        self._local.role = role
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, initializer=self._mark, initargs=('executor',))
+            return self._executor
+
+    @property
+    def crawler(self):
+        """嵌套并行专用线程池，主线程池的任务再次调用map或stream时提交到这里"""
+        with self._lock:
+            if self._crawler is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._crawler = ThreadPoolExecutor(
+                    max_workers=self.workers, initializer=self._mark, initargs=('crawler',))
+            return self._crawler
+
+    def _fanout(self):
+        """
+        选择提交任务的线程池，避免线程池中的任务等待同一线程池而死锁
+        主线程池中再次并行时使用嵌套线程池，嵌套线程池中再次并行时返回None，由调用方在当前线程执行
+        """
+        role = getattr(self._local, 'role', None)
+        if role is None:
+            return self.executor
+        if role == 'executor':
+            return self.crawler
+        return None
+
+    @property
+    def hedger(self):
+        """对冲请求专用线程池，与主线程池分开，避免在主线程池任务中等待自身导致死锁"""
+        with self._lock:
+            if self._hedger is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._hedger = ThreadPoolExecutor(max_workers=self.pool_maxsize * 2)
+            return self._hedger
+
+    def session(self):
+        """新建会话，Cookie独立，连接池共享"""
+        import requests
+        sess = requests.Session()
+        sess.mount('http://', self.adapter)
+        sess.mount('https://', self.adapter)
+        return sess
+
+    def map(self, func, *iterables):
+        """并行执行，可在线程池的任务中嵌套调用"""
+        executor = self._fanout()
+        if executor is None:
+            return list(map(func, *iterables))
+        return list(executor.map(YSDeadline.wrap(tracer.wrap(func)), *iterables))
+
+    def submit(self, func, *args):
+        """
+        提交单个任务，可在线程池的任务中嵌套调用，嵌套过深时在当前线程执行
+        :return: Future
+        """
+        executor = self._fanout()
+        if executor is not None:
+            return executor.submit(YSDeadline.wrap(tracer.wrap(func)), *args)
+
+        from concurrent.futures import Future
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except BaseException as err:
+            future.set_exception(err)
+        return future
+
+    def stream(self, func, iterable, window=None):
+        """
+        按完成顺序逐个产出结果，最多同时有window个任务在进行或等待消费，消费方处理慢时暂停提交
+        :param func: 任务函数
+        :param iterable: 任务参数
+        :param window: 预取窗口大小，默认为线程池大小
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        executor = self._fanout()
+        if executor is None:
+            yield from map(func, iterable)
+            return
+
+        func = YSDeadline.wrap(tracer.wrap(func))
+        window = max(1, window or self.workers)
+        items = iter(iterable)
+        pending = set()
+        try:
+            while True:
+                for item in itertools.islice(items, window - len(pending)):
+                    pending.add(executor.submit(func, item))
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # 消费方提前退出或任务出错时，放弃尚未开始的任务
+            for future in pending:
+                future.cancel()
+
+    def limiter(self, host) -> Optional[AdaptiveLimiter]:
+        if not self.adaptive:
+            return None
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = AdaptiveLimiter(
+                    initial=self.initial_limit, max_limit=self.max_limit)
+            return limiter
+
+    @contextmanager
+    def slot(self, limit: Optional[threading.Semaphore] = None, url=None):
+        """
+        占用一个请求名额，依次占用局部名额、全局名额和目标主机的自适应名额
+        当前线程有截止时间时，等待名额超时即放弃
+        :return: 请求结果对象，调用方通过observe反馈响应
+        """
+        deadline = YSDeadline.current()
+        if limit:
+            _wait_slot(limit.acquire, deadline)
+        try:
+            if self._limit:
+                _wait_slot(self._limit.acquire, deadline)
+            try:
+                limiter = self.limiter(urlsplit(url).netloc) if url else None
+                if limiter:
+                    with limiter.slot(deadline) as outcome:
+                        yield outcome
+                else:
+                    yield _Outcome()
+            finally:
+                if self._limit:
+                    self._limit.release()
+        finally:
+            if limit:
+                limit.release()
+
+    def metrics(self):
+        """传输层指标，包括各主机当前的并发限制"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return dict(
+            max_requests=self.max_requests,
+            workers=self.workers,
+            hosts={host: limiter.d() for host, limiter in limiters.items()},
+        )
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._crawler is not None:
+                self._crawler.shutdown(wait=False)
+                self._crawler = None
+            if self._hedger is not None:
+                self._hedger.shutdown(wait=False)
+                self._hedger = None
+            if self._adapter is not None:
+                self._adapter.close()
+                self._adapter = None
+
+
+class Fetcher:
+    def __init__(self, transport: Transport = None, max_requests=None, cassette=None, hedge=None,
+                 hedge_after=1.0):
+        """
+        :param transport: 传输层，为空时独占一个
+        :param max_requests: 该Fetcher同时进行的请求数上限，None表示不限制
+        :param cassette: 请求录像YSCassette，录制模式下保存响应，回放模式下不访问网络
+        :param hedge: 对冲请求的延迟分位数（如0.95），幂等请求超过该分位延迟仍未完成时再发一个副本
+        :param hedge_after: 延迟样本不足时使用的对冲等待秒数
+        """
+        self.transport = transport or Transport()
+        self.cassette = cassette
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self._limit = threading.BoundedSemaphore(max_requests) if max_requests else None
+        self._sess = None
+        self._sess_lock = threading.Lock()
+        self.flight = SingleFlight()
+
+        self._latencies = dict()  # type: Dict[str, Deque[float]] # 各接口最近的延迟
+        self._latency_lock = threading.Lock()
+
+    @property
+    def sess(self):
+        """首次请求时才加载requests并建立会话，多线程同时首次请求时只建立一个"""
+        sess = self._sess
+        if sess is None:
+            with self._sess_lock:
+                if self._sess is None:
+                    self._sess = self.transport.session()
+                sess = self._sess
+        return sess
 
     def reset(self):
-        self.sess = requests.Session()
+        """换用新会话，进行中的请求继续使用原会话直至完成"""
+        with self._sess_lock:
+            self._sess = None
         return self
 
     @staticmethod
-    def request(caller: Callable, url, decode=True, soup=False, jsonify=False, **kwargs):
-        with caller(url, **kwargs) as resp:
-            data = resp.content
-        if decode or soup or jsonify:
-            data = data.decode()
+    def parse(data, soup=False, jsonify=False):
+        """
+        解码并解析响应体
+        :param data: 响应体，可以是bytes或memoryview
+        """
+        with tracer.span('parse'):
+            data = bytes(data).decode()
             if soup:
+                from bs4 import BeautifulSoup as Souper
                 data = Souper(data, 'html.parser')
             if jsonify:
                 data = json.loads(data)
         return data
 
-    def get(self, url, **kwargs):
-        return self.request(self.sess.get, url, **kwargs)
+    def request(self, caller: Callable, url, decode=True, soup=False, jsonify=False, raw=False,
+                **kwargs):
+        """
+        :param raw: 直接返回响应体的memoryview，不解码也不解析，配合scan系列函数提取少量字段
+        """
+        deadline = YSDeadline.current()
+        if deadline:
+            deadline.check()
+        cassette = self.cassette
+        key = cassette.key(caller.__name__, url, kwargs.get('data')) if cassette else None
+        if cassette and cassette.replaying:
+            with tracer.span('network', endpoint=urlsplit(url).path, replay=True) as span:
+                status, data = cassette.play(key)
+                if span:
+                    span.set(status=status, size=len(data))
+        else:
+            if deadline:
+                kwargs['timeout'] = deadline.timeout(kwargs.get('timeout'))
+            endpoint = urlsplit(url).path
+            with tracer.span('network', endpoint=endpoint) as span, \
+                    self.transport.slot(self._limit, url) as outcome:
+                with caller(url, **kwargs) as resp:
+                    outcome.observe(resp)
+                    data = resp.content
+                if span:
+                    span.set(status=resp.status_code, size=len(data))
+            if self.hedge:
+                self._observe(endpoint, outcome.latency)
+            if cassette:
+                cassette.record(key, resp.status_code, data)
+        if raw:
+            return memoryview(data)
+        if decode or soup or jsonify:
+            data = self.parse(data, soup=soup, jsonify=jsonify)
+        return data
+
+    def _observe(self, endpoint, latency):
+        if latency is None:
+            return
+        with self._latency_lock:
+            window = self._latencies.get(endpoint)
+            if window is None:
+                window = self._latencies[endpoint] = deque(maxlen=256)
+            window.append(latency)
+
+    def hedge_delay(self, endpoint):
+        """对冲等待时间，取该接口最近延迟的分位数，样本不足时使用hedge_after"""
+        with self._latency_lock:
+            window = sorted(self._latencies.get(endpoint, ()))
+        if len(window) < 16:
+            return self.hedge_after
+        return window[int(self.hedge * (len(window) - 1))]
+
+    @staticmethod
+    def _settle(futures, deadline: Optional[YSDeadline], timeout=None) -> set:
+        """
+        等待任一请求完成，timeout内未完成时返回空集合
+        有截止令牌时分段等待，取消或超时时抛出异常，放弃仍在进行的请求
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        if deadline is None:
+            return wait(futures, timeout, FIRST_COMPLETED).done
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            step = deadline.check().timeout(YSDeadline.POLL_SECONDS)
+            if end is not None:
+                step = min(step, max(0.0, end - time.monotonic()))
+            done = wait(futures, step, FIRST_COMPLETED).done
+            if done or (end is not None and time.monotonic() >= end):
+                return done
+
+    def _hedged(self, url, **kwargs):
+        """首个请求超过对冲等待时间仍未完成时再发一个副本，取先成功的结果"""
+        deadline = YSDeadline.current()
+        delay = self.hedge_delay(urlsplit(url).path)
+
+        func = YSDeadline.wrap(tracer.wrap(lambda: self.request(self.sess.get, url, **kwargs)))
+        hedger = self.transport.hedger
+        pending = {hedger.submit(func)}
+        done = self._settle(pending, deadline, delay)
+        if not done:
+            with tracer.span('hedge', endpoint=urlsplit(url).path, delay=delay):
+                pending.add(hedger.submit(func))
+
+        error = None
+        while True:
+            pending -= done
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as err:
+                    error = err
+            if not pending:
+                raise error
+            done = self._settle(pending, deadline)
+
+    def get(self, url, flight=None, hedge=False, **kwargs):
+        """
+        :param flight: 逻辑请求键，不为空时合并相同键的并发请求，仅用于幂等请求
+        :param hedge: 是否允许对冲请求，仅用于幂等请求，需在初始化时设置hedge分位数
+        """
+        if hedge and self.hedge and not (self.cassette and self.cassette.replaying):
+            fetch = functools.partial(self._hedged, url, **kwargs)
+        else:
+            fetch = functools.partial(self.request, self.sess.get, url, **kwargs)
+        if flight is None:
+            return fetch()
+        key = (flight, tuple(sorted(kwargs.items())))
+        return self.flight.do(key, fetch)
 
     def post(self, url, data=None, json=None, **kwargs):
         kwargs.update(dict(data=data, json=json))
@@ -78,3 +956,40 @@ class Fetcher:
     def put(self, url, data=None, **kwargs):
         kwargs.update(dict(data=data))
         return self.request(self.sess.put, url, **kwargs)
+
+    def download(self, url, filepath, chunk_size=64 * 1024, **kwargs):
+        """
+        流式下载到本地文件，先写入临时文件再原子替换
+        :param url: 下载链接
+        :param filepath: 本地保存路径
+        :param chunk_size: 分块大小
+        :return: 写入的字节数
+        """
+        tmp_path = '{0}.part'.format(filepath)
+        size = 0
+        deadline = YSDeadline.current()
+        if deadline:
+            kwargs['timeout'] = deadline.check().timeout(kwargs.get('timeout'))
+        try:
+            if self.cassette:
+                # 录像模式下整体读取响应体以便录制或回放
+                data = self.request(self.sess.get, url, decode=False, **kwargs)
+                with open(tmp_path, 'wb') as f:
+                    size = f.write(data)
+                os.replace(tmp_path, filepath)
+                return size
+            with self.transport.slot(self._limit, url) as outcome, \
+                    self.sess.get(url, stream=True, **kwargs) as resp:
+                outcome.observe(resp)
+                resp.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in resp.iter_content(chunk_size):
+                        if deadline:
+                            deadline.check()
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return size
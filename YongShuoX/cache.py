@@ -0,0 +1,229 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from smartify import E
+
+from .base import _Dictifier, SingleFlight
+
+
+@E.register()
+class CacheError:
+    TOO_SMALL = E("下载缓存容量过小，文件写入后立即被淘汰")
+
+
+class YSDownloadCache(_Dictifier):
+    """
+    文件下载磁盘缓存，以空间ID、文件ID和链接、标签、类型的指纹为键，超出容量时按最近最少使用淘汰
+    键中包含空间ID，同一缓存可在多个空间之间共享
+    写入先落到临时文件再原子改名，读取方持有打开的文件对象，淘汰不会影响正在读取的文件
+    """
+
+    # 超过该秒数未修改的临时文件视为崩溃的写入方遗留，加载时删除
+    STALE_TMP_SECONDS = 3600
+
+    def __init__(self, path, max_bytes=1 << 30):
+        """
+        :param path: 缓存目录
+        :param max_bytes: 缓存总容量，单位为字节
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()  # type: OrderedDict[str, int] # 缓存文件名 -> 大小，按使用排序
+        self._ids = dict()  # type: Dict[str, str] # 空间与文件ID -> 缓存文件名
+        self._lock = threading.Lock()
+        self.flight = SingleFlight()
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def _safe_id(file) -> str:
+        """空间ID与文件ID组成的标识，不同空间的文件ID可能相同"""
+        return re.sub(r'[^\w]', '_', '{0}_{1}'.format(file.core.bucket, file.id))
+
+    def key(self, file) -> str:
+        """缓存文件名，文件的链接、标签或类型变化时随之变化"""
+        fingerprint = json.dumps([file.link, file.label, file.ftype], ensure_ascii=False)
+        digest = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+        return '{0}-{1}'.format(self._safe_id(file), digest)
+
+    def _local(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """按修改时间恢复使用顺序，同一文件只保留最近的一份，并清理遗留的临时文件"""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.path):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.startswith('.'):
+                # 正在写入的临时文件会持续更新修改时间，只删除长时间未修改的
+                if now - stat.st_mtime > self.STALE_TMP_SECONDS:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            file_id = name.rsplit('-', 1)[0]
+            stale = self._ids.get(file_id)
+            if stale is not None:
+                self._remove(stale)
+            self._entries[name] = size
+            self._ids[file_id] = name
+            self.bytes += size
+        self._evict()
+
+    def _remove(self, name):
+        """删除缓存文件，调用方需持有锁"""
+        size = self._entries.pop(name, None)
+        if size is None:
+            return
+        self.bytes -= size
+        file_id = name.rsplit('-', 1)[0]
+        if self._ids.get(file_id) == name:
+            del self._ids[file_id]
+        try:
+            os.remove(self._local(name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep=None):
+        """按最近最少使用淘汰至容量以内，调用方需持有锁"""
+        for name in list(self._entries):
+            if self.bytes <= self.max_bytes:
+                break
+            if name != keep:
+                self._remove(name)
+                self.evictions += 1
+
+    def _open(self, name, hit=True):
+        with self._lock:
+            if name not in self._entries:
+                return None
+            try:
+                f = open(self._local(name), 'rb')
+            except FileNotFoundError:
+                self._remove(name)
+                return None
+            self._entries.move_to_end(name)
+            self.hits += hit
+        try:
+            os.utime(self._local(name))  # 记录使用顺序，重启后按修改时间恢复
+        except OSError:
+            pass
+        return f
+
+    def _fill(self, name, file_id, downloader: Callable[[str], int]):
+        fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=self.path)
+        os.close(fd)
+        try:
+            downloader(tmp_path)
+            size = os.path.getsize(tmp_path)
+            with self._lock:
+                os.replace(tmp_path, self._local(name))
+                self.bytes -= self._entries.pop(name, 0)
+                stale = self._ids.get(file_id)
+                if stale is not None and stale != name:
+                    self._remove(stale)
+                self._entries[name] = size
+                self._ids[file_id] = name
+                self.bytes += size
+                self.misses += 1
+                self._evict(keep=name)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def open(self, file, downloader: Callable[[str], int]):
+        """
+        打开缓存文件，未命中时下载，同一文件的并发下载只进行一次
+        :param file: YSFile
+        :param downloader: 下载函数，参数为本地路径
+        :return: 只读二进制文件对象
+        """
+        name = self.key(file)
+        file_id = self._safe_id(file)
+        f = self._open(name)
+        for _ in range(3):
+            if f is not None:
+                return f
+            self.flight.do(name, lambda: self._fill(name, file_id, downloader))
+            # 容量过小时，刚写入的文件可能被其他线程的写入淘汰
+            f = self._open(name, hit=False)
+        raise CacheError.TOO_SMALL
+
+    def copy(self, file, downloader: Callable[[str], int], filepath):
+        """
+        从缓存复制到本地路径，先写入临时文件再原子替换
+        :return: 写入的字节数
+        """
+        tmp_path = '{0}.part'.format(filepath)
+        try:
+            with self.open(file, downloader) as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                size = dst.tell()
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return size
+
+    def mmap(self, file, downloader: Callable[[str], int]):
+        """
+        以只读内存映射读取缓存文件，映射在缓存文件被淘汰后仍然有效
+        :return: mmap对象，空文件返回b''
+        """
+        with self.open(file, downloader) as f:
+            if not os.fstat(f.fileno()).st_size:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, file) -> Optional[str]:
+        """已缓存时返回缓存文件路径，不会触发下载"""
+        name = self.key(file)
+        with self._lock:
+            return self._local(name) if name in self._entries else None
+
+    def revalidate(self, file):
+        """文件的链接、标签或类型变化后，删除旧的缓存"""
+        file_id = self._safe_id(file)
+        with self._lock:
+            name = self._ids.get(file_id)
+            if name is not None and name != self.key(file):
+                self._remove(name)
+        return self
+
+    def discard(self, file):
+        with self._lock:
+            name = self._ids.get(self._safe_id(file))
+            if name is not None:
+                self._remove(name)
+        return self
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._entries):
+                self._remove(name)
+        return self
+
+    def d(self):
+        return self.dictify('path', 'max_bytes', 'bytes', 'hits', 'misses', 'evictions')
@@ -0,0 +1,107 @@
+import base64
+import gzip
+import json
+import os
+import re
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from smartify import E
+
+
+@E.register()
+class CassetteError:
+    MISS = E("录像中没有对应的请求")
+    BAD_MODE = E("录像模式只能是record或replay")
+
+
+class YSCassette:
+    """请求录像，录制真实的请求与响应并脱敏保存，回放时不访问网络"""
+
+    RECORD = 'record'
+    REPLAY = 'replay'
+
+    # 口令、密码和随时间变化的参数，不参与匹配且不写入录像
+    SECRETS = {'_dlmm', 'kqmm', 'glmm', 'teqtbz', 'te_yzm', 'pz', 'yzm'}
+    VOLATILE = {'sj', '__VIEWSTATE', '__EVENTVALIDATION'}
+
+    _BODY_SECRETS = [
+        (re.compile(rb"_dlmm:'[^']*'"), b"_dlmm:''"),
+        (re.compile(rb'_dlmm=[^&"\'\s]*'), b'_dlmm='),
+    ]
+
+    def __init__(self, path, mode=REPLAY):
+        """
+        :param path: 录像文件路径，gzip压缩的JSON行
+        :param mode: record录制或replay回放
+        """
+        if mode not in (self.RECORD, self.REPLAY):
+            raise CassetteError.BAD_MODE
+        self.path = path
+        self.mode = mode
+        self._entries = dict()  # 请求键 -> 响应队列
+        self._lock = threading.Lock()
+
+        if mode == self.REPLAY:
+            self._load()
+        elif os.path.exists(path):
+            os.remove(path)
+
+    @property
+    def recording(self):
+        return self.mode == self.RECORD
+
+    @property
+    def replaying(self):
+        return self.mode == self.REPLAY
+
+    def _scrub_pairs(self, pairs):
+        return [(k, '' if k in self.SECRETS else v) for k, v in pairs if k not in self.VOLATILE]
+
+    def key(self, method, url, data=None):
+        """
+        脱敏后的请求键
+        :param method: 请求方法
+        :param url: 请求地址
+        :param data: 表单数据
+        """
+        parts = urlsplit(url)
+        query = self._scrub_pairs(parse_qsl(parts.query, keep_blank_values=True))
+        form = None
+        if isinstance(data, dict):
+            form = sorted(self._scrub_pairs((k, str(v)) for k, v in data.items() if v is not None))
+        return json.dumps([method.upper(), parts.netloc, parts.path, urlencode(query), form],
+                          ensure_ascii=False)
+
+    def scrub(self, body: bytes) -> bytes:
+        for pattern, replacement in self._BODY_SECRETS:
+            body = pattern.sub(replacement, body)
+        return body
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                self._entries.setdefault(entry['k'], deque()).append(
+                    (entry['s'], base64.b64decode(entry['b'])))
+
+    def record(self, key, status, body: bytes):
+        """追加一条响应，按gzip分段追加写入，录制中断也不丢失已录部分"""
+        line = json.dumps(dict(k=key, s=status, b=base64.b64encode(self.scrub(body)).decode()),
+                          ensure_ascii=False)
+        with self._lock, gzip.open(self.path, 'at', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+    def play(self, key):
+        """
+        取出一条响应，同一请求多次录制时按顺序返回，最后一条可重复回放
+        :return: (状态码, 响应体)
+        """
+        with self._lock:
+            responses = self._entries.get(key)
+            if not responses:
+                raise CassetteError.MISS(debug_message=key)
+            if len(responses) > 1:
+                return responses.popleft()
+            return responses[0]
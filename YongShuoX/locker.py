@@ -1,12 +1,14 @@
 import base64
 import datetime
 import re
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Optional, Union
 
-from bs4 import BeautifulSoup as Souper
 from smartify import E
 
-from YongShuoX.base import _Dictifier, YSError
+from YongShuoX.base import _Dictifier, YSError, Fetcher, traced, scan, scan_group
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup as Souper
 
 
 @E.register()
@@ -16,6 +18,13 @@ class LockerE:
     CAPTCHA = E("需要验证码")
 
 
+# 认证结果只需在原始响应体中查找少量字段，无需解码和解析
+_FOLDER_OK = re.compile(rb'"xzzt":true')
+_ADMIN_OK = re.compile(rb'bgglzt\(true\)')
+_HOST_OK = re.compile(rb'id=["\']?kjbt\b')
+_HOST_TOKEN = re.compile(rb"_dlmm:'(.*?)'")
+
+
 class YSLocker(_Dictifier):
     """认证类"""
 
@@ -41,6 +50,11 @@ class YSLocker(_Dictifier):
     def _enok(self):
         raise YSError.NOT_IMPLEMENTED
 
+    def _login(self) -> bool:
+        """发送认证请求，只返回结果，不修改认证状态"""
+        raise YSError.NOT_IMPLEMENTED
+
+    @traced('auth')
     def auth(self, password):
         """密钥认证"""
         if not self.ok:
@@ -52,9 +66,8 @@ class YSLocker(_Dictifier):
         return self.dictify('ok', 'password')
 
     def reset(self):
-        self.ok = False
-        if self.password:
-            self._enok()
+        """重新认证，新的认证结果返回后才替换认证状态，其他线程不会看到未认证的中间状态"""
+        self.ok = bool(self.password) and self._login()
 
 
 class YSFolderLocker(YSLocker):
@@ -74,9 +87,11 @@ class YSFolderLocker(YSLocker):
     def _enok(self):
         if self.ok:
             raise LockerE.AUTHED
+        self.ok = self._login()
 
-        data = self.client.core.sess.get(self._enok_uri(), decode=True)
-        self.ok = data.find('"xzzt":true') >= 0
+    def _login(self):
+        data = self.client.core.sess.get(self._enok_uri(), raw=True)
+        return scan(data, _FOLDER_OK)
 
 
 class YSAdminLocker(YSLocker):
@@ -92,22 +107,27 @@ class YSAdminLocker(YSLocker):
     def _enok(self):
         if self.ok:
             raise LockerE.AUTHED
+        self.ok = self._login()
 
-        data = self.client.sess.post(self._enok_uri(), data=dict(glmm=self.password), decode=True)
-        self.ok = data.find('bgglzt(true)') >= 0
+    def _login(self):
+        data = self.client.sess.post(self._enok_uri(), data=dict(glmm=self.password), raw=True)
+        return scan(data, _ADMIN_OK)
 
 
 class YSEntranceLocker(YSLocker):
     """访问认证器"""
 
-    def __init__(self, **kwargs):
+    def __init__(self, page=None, **kwargs):
+        """
+        :param page: 已获取的空间主页原始响应体，为空时重新获取
+        """
         super(YSEntranceLocker, self).__init__(**kwargs)
 
         self.require_captcha = None  # type: Optional[bool] # 是否需要验证码
         self.captcha_image = None  # type: Optional[str] # 验证码图片
         self.captcha = None  # type: Optional[str] # 用户输入的验证码字符串
         self.__EVENTVALIDATION = self.__VIEWSTATE = None  # 表单参数
-        self.reset()
+        self.reset(page)
 
     def _readable_captcha_image(self):
         if self.captcha_image:
@@ -118,9 +138,12 @@ class YSEntranceLocker(YSLocker):
         dict_.update(self.dictify('require_captcha', 'captcha_image'))
         return dict_
 
-    def reset(self):
-        """重新监测"""
-        self._check_if_require_captcha()
+    def reset(self, page=None):
+        """
+        重新监测
+        :param page: 已获取的空间主页原始响应体，为空时重新获取
+        """
+        self._check_if_require_captcha(page)
         return self
 
     def _captcha_uri(self):
@@ -130,17 +153,21 @@ class YSEntranceLocker(YSLocker):
     def _enok_uri(self):
         return '{0}/login.aspx?d={1}'.format(self.client.host, self.client.bucket)
 
-    def _extract_host_soup(self, soup: Souper):
-        if soup.find(id='kjbt'):
+    def _extract_host(self, page):
+        """从空间主页原始响应体中提取认证状态，已认证时只做字节扫描"""
+        if scan(page, _HOST_OK):
             self.ok = True
             self.captcha = None
             self.captcha_image = None
             self.__VIEWSTATE = None
             self.__EVENTVALIDATION = None
-            matcher = re.search("_dlmm:'(.*?)'", str(soup))
-            self.client.token = matcher.group(1) if matcher else ''
+            self.client.token = scan_group(page, _HOST_TOKEN) or ''
             return
 
+        # 未认证时需要登录表单的参数，才解析整个页面
+        self._extract_host_soup(Fetcher.parse(page, soup=True))
+
+    def _extract_host_soup(self, soup: 'Souper'):
         self.ok = False
         captcha_box = soup.find(id='yzm_tr')
         if captcha_box.get('style') == 'display: none;':
@@ -152,12 +179,14 @@ class YSEntranceLocker(YSLocker):
         self.__VIEWSTATE = soup.find(id='__VIEWSTATE').get('value')
         self.__EVENTVALIDATION = soup.find(id='__EVENTVALIDATION').get('value')
 
-    def _check_if_require_captcha(self):
-        soup = self.client.sess.get(self.client.host, soup=True)  # type: Souper
-        self._extract_host_soup(soup)
+    def _check_if_require_captcha(self, page=None):
+        if page is None:
+            page = self.client.sess.get(self.client.host, raw=True)
+        self._extract_host(page)
 
         if self.ok:
             self.require_captcha = False
+        return page
 
     def _enok(self):
         if self.require_captcha and not self.captcha:
@@ -174,13 +203,19 @@ class YSEntranceLocker(YSLocker):
             teqtbz=self.password,
         )
 
-        soup = self.client.sess.post(self._enok_uri(), form_data, soup=True)
-        self._extract_host_soup(soup)
+        page = self.client.sess.post(self._enok_uri(), form_data, raw=True)
+        self._extract_host(page)
+        return page
+
+    def login(self, password, captcha=None):
+        """密钥认证，返回登录后的空间主页原始响应体"""
+        self.captcha = captcha or self.captcha
+        self.password = password
+        return self._enok()
 
+    @traced('auth')
     def auth(self, password, captcha=None):
         """密钥认证"""
         if not self.ok:
-            self.captcha = captcha or self.captcha
-            self.password = password
-            self._enok()
+            self.login(password, captcha)
         return self.ok
@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple, Union, Optional
+
+from smartify import E
+
+from .base import _Dictifier, YSDeadline
+from .modules import YSNodeType
+from .node import YS, YSMainFolder, YSFolder, YSFile
+
+
+@E.register()
+class MirrorError:
+    FOLDER_NOT_FOUND = E("找不到指定的根目录")
+    DOWNLOAD_FAILED = E("文件下载失败")
+
+
+class YSMirrorReport(_Dictifier):
+    """镜像同步报告"""
+
+    def __init__(self):
+        self.downloaded = 0  # 新增或更新的文件数
+        self.skipped = 0  # 未变化的文件数
+        self.moved = 0  # 本地重命名的文件数
+        self.deleted = 0  # 本地删除的文件数
+        self.failed = []  # 下载失败的文件路径
+        self.bytes = 0  # 下载字节数
+        self.seconds = 0.0  # 同步耗时
+
+    @property
+    def throughput(self):
+        """下载速度，单位为字节每秒"""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def d(self):
+        return self.dictify(
+            'downloaded', 'skipped', 'moved', 'deleted', 'failed', 'bytes', 'seconds', 'throughput')
+
+    def __str__(self):
+        return '下载 {0}，跳过 {1}，移动 {2}，删除 {3}，失败 {4}，共 {5} 字节，耗时 {6:.2f} 秒，{7:.1f} KB/s'.format(
+            self.downloaded, self.skipped, self.moved, self.deleted, len(self.failed),
+            self.bytes, self.seconds, self.throughput / 1024)
+
+
+class YSMirror:
+    """增量镜像器，将网盘或单个根目录同步到本地目录"""
+
+    STATE_FILE = '.ysmirror.json'
+
+    def __init__(self, source: Union[YS, YSMainFolder], target,
+                 state_file=None, workers=4, retries=3, delete=True):
+        """
+        :param source: 同步源，网盘或根目录
+        :param target: 本地目标目录
+        :param state_file: 状态文件路径，默认位于目标目录下
+        :param workers: 并行下载数
+        :param retries: 单个文件的重试次数
+        :param delete: 是否删除远端已不存在的本地文件
+        """
+        self.source = source
+        self.target = target
+        self.state_file = state_file or os.path.join(target, self.STATE_FILE)
+        self.workers = max(workers, 1)
+        self.retries = max(retries, 0)
+        self.delete = delete
+
+    @staticmethod
+    def _safe_name(name):
+        return re.sub(r'[\\/:*?"<>|\0]', '_', name or '').strip() or '_'
+
+    def _walk(self, folder: YSFolder, prefix):
+        for node in folder.nodes:
+            path = os.path.join(prefix, self._safe_name(node.name))
+            if node.type == YSNodeType.FILE:
+                yield path, node
+            elif node.type == YSNodeType.FOLDER:
+                yield from self._walk(node, path)
+
+    @staticmethod
+    def _list_root(root: YSMainFolder):
+        """获取根目录权限与列表，无权列出或下载、或获取失败时返回False"""
+        try:
+            root.fetch_rights()
+            if not (root.rights.allow_list and root.rights.allow_download):
+                return False
+            root.fetch_nodes()
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _under(path, prefixes):
+        return any(not prefix or path == prefix or path.startswith(prefix + os.sep)
+                   for prefix in prefixes)
+
+    def _fetch_remote(self) -> Tuple[Dict[str, tuple], List[str]]:
+        """
+        获取远端文件列表，以文件ID为键，本地路径冲突的文件在文件名后加上文件ID
+        :return: 远端文件列表，以及未能列出的根目录对应的本地路径前缀
+        """
+        files = []
+        skipped = []
+        if isinstance(self.source, YS):
+            self.source.fetch_nodes()
+            roots = [root for root in self.source.nodes if isinstance(root, YSMainFolder)]
+            listed = self.source.sess.transport.map(self._list_root, roots)
+            for root, ok in zip(roots, listed):
+                prefix = self._safe_name(root.name)
+                if ok:
+                    files.extend(self._walk(root, prefix))
+                else:
+                    skipped.append(prefix)
+        elif self._list_root(self.source):
+            files.extend(self._walk(self.source, ''))
+        else:
+            skipped.append('')
+
+        remote = dict()
+        used = set()
+        for path, file in files:
+            if path in used:
+                base, ext = os.path.splitext(path)
+                path = '{0}.{1}{2}'.format(base, self._safe_name(str(file.id)), ext)
+            used.add(path)
+            remote[file.id] = (path, file)
+        return remote, skipped
+
+    def _load_state(self) -> Dict[str, dict]:
+        if not os.path.exists(self.state_file):
+            return dict()
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get('files', dict())
+
+    def _save_state(self, files):
+        tmp_path = '{0}.part'.format(self.state_file)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(files=files), f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_file)
+
+    @staticmethod
+    def _entry(path, file: YSFile):
+        return dict(path=path, name=file.name, label=file.label, link=file.link, ftype=file.ftype)
+
+    @staticmethod
+    def _changed(entry: Optional[dict], file: YSFile):
+        return entry is None or entry.get('link') != file.link or entry.get('label') != file.label
+
+    def _local(self, path):
+        return os.path.join(self.target, path)
+
+    def _remove(self, path):
+        local = self._local(path)
+        if os.path.exists(local):
+            os.remove(local)
+            return True
+        return False
+
+    def _move(self, moves):
+        """
+        两阶段移动，先全部移入临时目录再移到新路径，互换名称的文件不会互相覆盖
+        :param moves: (旧路径, 新路径)列表
+        """
+        if not moves:
+            return
+        staging = tempfile.mkdtemp(prefix='.ysmirror-', dir=self.target)
+        try:
+            staged = []
+            for index, (old, new) in enumerate(moves):
+                tmp_path = os.path.join(staging, str(index))
+                os.replace(self._local(old), tmp_path)
+                staged.append((tmp_path, new))
+            for tmp_path, new in staged:
+                local = self._local(new)
+                os.makedirs(os.path.dirname(local) or self.target, exist_ok=True)
+                os.replace(tmp_path, local)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _download(self, path, file: YSFile):
+        """带指数退避重试的下载"""
+        local = self._local(path)
+        os.makedirs(os.path.dirname(local) or self.target, exist_ok=True)
+        deadline = YSDeadline.current()
+        for attempt in range(self.retries + 1):
+            try:
+                return file.download(local)
+            except Exception as err:
+                if attempt == self.retries or (deadline and deadline.expired):
+                    raise MirrorError.DOWNLOAD_FAILED(debug_message=err)
+                delay = min(2 ** attempt * 0.5, 30)
+                if deadline:
+                    deadline.sleep(delay)
+                else:
+                    time.sleep(delay)
+
+    def sync(self, deadline=None) -> YSMirrorReport:
+        """
+        执行一次增量同步
+        :param deadline: 截止秒数或YSDeadline令牌，到期后未完成的文件记为失败，下次同步时重试
+        """
+        with YSDeadline.scope(deadline):
+            return self._sync()
+
+    def _sync(self) -> YSMirrorReport:
+        report = YSMirrorReport()
+        start = time.time()
+        os.makedirs(self.target, exist_ok=True)
+
+        state = self._load_state()
+        remote, skipped = self._fetch_remote()
+        live = {path for path, _ in remote.values()}  # 本次同步后应存在的本地路径
+        files = dict()
+        tasks = []
+        moves = []
+
+        # 未能列出的根目录下的文件保留旧状态，不做删除
+        for id_, entry in state.items():
+            if id_ not in remote and self._under(entry['path'], skipped):
+                files[id_] = entry
+
+        for id_, (path, file) in remote.items():
+            entry = state.get(id_)
+            if self._changed(entry, file):
+                tasks.append((id_, path, file))
+                continue
+            if entry['path'] != path and os.path.exists(self._local(entry['path'])):
+                moves.append((entry['path'], path))
+                report.moved += 1
+            elif not os.path.exists(self._local(path)):
+                tasks.append((id_, path, file))
+                continue
+            else:
+                report.skipped += 1
+            files[id_] = self._entry(path, file)
+        self._move(moves)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            download = YSDeadline.wrap(self._download)
+            futures = {executor.submit(download, path, file): (id_, path, file)
+                       for id_, path, file in tasks}
+            for future in as_completed(futures):
+                id_, path, file = futures[future]
+                try:
+                    report.bytes += future.result()
+                except E:
+                    report.failed.append(path)
+                    if id_ in state:
+                        # 保留旧状态，下次同步时重试
+                        files[id_] = state[id_]
+                    continue
+                report.downloaded += 1
+                old = state.get(id_)
+                if old and old['path'] != path and old['path'] not in live:
+                    self._remove(old['path'])
+                files[id_] = self._entry(path, file)
+
+        if self.delete:
+            for id_, entry in state.items():
+                # 删除后以同名重新上传的文件ID不同，但路径仍被占用，不能删除
+                if id_ not in remote and entry['path'] not in live \
+                        and not self._under(entry['path'], skipped) \
+                        and self._remove(entry['path']):
+                    report.deleted += 1
+
+        self._save_state(files)
+        report.seconds = time.time() - start
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ysmirror', description='将永硕网盘增量同步到本地目录')
+    parser.add_argument('bucket', help='永硕空间ID')
+    parser.add_argument('target', help='本地目标目录')
+    parser.add_argument('--password', help='管理员密码')
+    parser.add_argument('--entrance', help='空间进入密码')
+    parser.add_argument('--folder', help='仅同步指定ID的根目录')
+    parser.add_argument('--folder-password', help='根目录访问密码')
+    parser.add_argument('--state', help='状态文件路径')
+    parser.add_argument('--workers', type=int, default=4, help='并行下载数')
+    parser.add_argument('--retries', type=int, default=3, help='单个文件的重试次数')
+    parser.add_argument('--no-delete', action='store_true', help='保留远端已删除的本地文件')
+    parser.add_argument('--timeout', type=float, help='整次同步的截止秒数')
+    args = parser.parse_args(argv)
+
+    source = YS(args.bucket, password=args.password, entrance=args.entrance)
+    if args.folder:
+        source.fetch_nodes()
+        folder = source.get_folder(args.folder)
+        if not folder:
+            raise MirrorError.FOLDER_NOT_FOUND
+        if args.folder_password:
+            folder.auth(args.folder_password)
+        source = folder
+
+    report = YSMirror(source, args.target,
+                      state_file=args.state,
+                      workers=args.workers,
+                      retries=args.retries,
+                      delete=not args.no_delete).sync(deadline=args.timeout)
+    print(report)
+    return 1 if report.failed else 0
@@ -1,9 +1,11 @@
 import copy
-from typing import Union, List, Optional
+from typing import TYPE_CHECKING, Union, List, Optional
 
-from bs4 import BeautifulSoup as Souper
+from .base import _Symbol, _Dictifier, Fetcher
 
-from .base import _Symbol, _Dictifier
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup as Souper
+    from .node import YSFolder
 
 
 class YSNodeType:
@@ -40,17 +42,65 @@ class YSNode(_Dictifier):
         :param label: 节点标签
         :param core: 节点所属的永硕网盘类
         """
+        self._path_string = None  # type: Optional[str] # 路径字符串缓存
+        self._parent = None
         self.name = name
         self.type = type_
         self.label = label or ''
 
-        from .node import YS, YSFolder
+        from .node import YS
         self.core = core  # type: YS
-        self.parent = parent  # type: YSFolder
+        self.parent = parent
 
     def __str__(self):
         return self.name
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        """重命名时使父目录的名称索引与自身路径缓存失效"""
+        self._name = name
+        if self._parent is not None:
+            self._parent._index = None
+        self._invalidate_path()
+
+    @property
+    def parent(self):
+        return self._parent  # type: YSFolder
+
+    @parent.setter
+    def parent(self, parent):
+        """移动时使路径缓存失效"""
+        self._parent = parent
+        self._invalidate_path()
+
+    def _invalidate_path(self):
+        self._path_string = None
+
+    @property
+    def path_string(self):
+        """不含根目录的路径字符串，缓存至重命名、移动或刷新，按父目录缓存拼接，开销为O(深度)"""
+        if self._path_string is None:
+            from .node import YSMainFolder
+            if isinstance(self, YSMainFolder) or self._parent is None:
+                self._path_string = ''
+            else:
+                prefix = self._parent.path_string
+                self._path_string = '{0}/{1}'.format(prefix, self.name) if prefix else self.name
+        return self._path_string
+
+    @property
+    def main_folder(self):
+        """所属的根目录"""
+        from .node import YSMainFolder
+        node = self
+        while not isinstance(node, YSMainFolder):
+            node = node.parent
+        return node
+
     def _readable_type(self):
         for key in YSNodeType.__dict__:
             type_ = getattr(YSNodeType, key, None)
@@ -88,7 +138,7 @@ class YSIdNode(YSNode):
     @id.setter
     def id(self, id_):
         if self._id is None:
-            self.id = id_
+            self._id = id_
 
     def d(self):
         dict_ = super(YSIdNode, self).d()
@@ -151,11 +201,17 @@ class YSZoneInfo(_Dictifier):
         self.friend_links = []  # type: List[YSFriendLink] # 友链
         self.comments = []  # type: List[YSComment]  # 留言板
 
-    def fetch_info(self):
-        """获取主页名称和友链信息"""
+    def fetch_info(self, page=None):
+        """
+        获取主页名称和友链信息
+        :param page: 已获取的空间主页原始响应体，为空时重新获取
+        """
         if not self.client.accessor.ok:
             return self
-        soup = self.client.sess.get(self.client.host, soup=True)  # type: Souper
+        if page is None:
+            soup = self.client.sess.get(self.client.host, soup=True)  # type: Souper
+        else:
+            soup = Fetcher.parse(page, soup=True)  # type: Souper
 
         self.client.name = soup.find(id='kjbt').text
         self.friend_links = [YSFriendLink(
@@ -238,6 +294,20 @@ class YSQuerySet:
         if layers < 0:
             layers = 1
 
+        # 目录搜索结果按资源树版本缓存，资源树变化后旧结果自然失效
+        core = getattr(self, 'core', None)
+        memo = getattr(core, 'query_memo', None)
+        if memo is None:
+            return self._search_nodes(name, label, id_, link, types, layers, flatten)
+
+        key = (self, name, label, id_, link, tuple(types), layers, flatten, core.version)
+        matched_set = memo.get(key)
+        if matched_set is None:
+            matched_set = self._search_nodes(name, label, id_, link, types, layers, flatten)
+            memo.put(key, matched_set)
+        return YSQuerySet(nodes=list(matched_set.nodes))
+
+    def _search_nodes(self, name, label, id_, link, types, layers, flatten) -> 'YSQuerySet':
         matched_set = []
         for node in self.nodes:
             node_name = getattr(node, 'name', None)
@@ -252,13 +322,14 @@ class YSQuerySet:
                     (node_ftype in types):
                 matched_set.append(node)
             elif node_ftype == YSNodeType.FOLDER and (layers == 0 or layers > 1):
-                matched_subset = node.search_nodes(name, label, id_, link, types, layers - 1,
-                                                   flatten)
+                matched_subset = node._search_nodes(name, label, id_, link, types,
+                                                    layers - 1 if layers else 0, flatten)
                 if flatten:
                     matched_set.extend(matched_subset.nodes)
                 else:
+                    # 只替换副本的子节点列表，不经过setter，避免使原节点的路径缓存失效
                     node_ = copy.copy(node)
-                    node_.nodes = matched_subset
+                    node_._nodes = matched_subset.nodes
                     matched_set.append(node_)
 
         return YSQuerySet(nodes=matched_set)
@@ -273,7 +344,11 @@ class YSQuerySet:
                                  layers=layers,
                                  flatten=flatten)
 
-    def get_node(self, id_, type_: _Symbol, layers=0, flatten=False) -> Optional[YSNode]:
+    def get_node(self, id_, type_: _Symbol, layers=0, flatten=True) -> Optional[YSNode]:
+        """
+        按ID获取节点
+        :param flatten: 为False时返回包含该节点的顶层目录副本
+        """
         matched_set = self.search_nodes(id_=id_, layers=layers, types=type_, flatten=flatten)
         if not matched_set.empty:
             return matched_set.nodes[0]
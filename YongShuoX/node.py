@@ -1,22 +1,83 @@
-import mimetypes
+import itertools
 import os
-import re
-from typing import List, Union, Optional
+import threading
+from collections import namedtuple
+from typing import TYPE_CHECKING, Dict, List, Union, Optional
 
-import bs4
-from bs4 import BeautifulSoup as Souper
 from smartify import E
 
 from .rights import YSFolderRights
 from .modules import YSIdNode, YSNodeType, YSNode, YSQuerySet, YSZoneInfo
-from .base import Fetcher, YSError
+from .base import _LRUCache, _Symbol, Fetcher, Transport, YSDeadline, YSError, traced, tracer, \
+    scan_group
 from .locker import YSFolderLocker, YSAdminLocker, YSEntranceLocker
 
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup as Souper
+
 
 @E.register()
 class NodeError:
     NOT_AUTHOR = E("需要管理员权限")
     INACCESSIBLE = E("需要访问密码")
+    NOT_DOWNLOADABLE = E("没有下载权限")
+    NO_CACHE = E("没有设置下载缓存")
+
+
+# 目录列表中一个节点的紧凑记录，可在进程间传递；zml子目录的children为其子节点记录
+YSNodeRecord = namedtuple(
+    'YSNodeRecord', ['class_', 'id', 'name', 'label', 'link', 'ftype', 'children'])
+
+_RECORD_TYPES = dict(
+    gml=YSNodeType.FOLDER, xwz=YSNodeType.TEXT, xlj=YSNodeType.LINK, xwj=YSNodeType.FILE)
+
+
+def _extract_records(soup: 'Souper') -> List[YSNodeRecord]:
+    import bs4
+    records = []
+    for child in soup.children:
+        if not isinstance(child, bs4.Tag) or not child.name == 'li':
+            continue
+
+        class_ = child.get('class')[0]
+        if class_ not in ['zml', 'gml', 'xwz', 'xlj', 'xwj']:
+            continue
+
+        if class_ == 'zml':
+            records.append(YSNodeRecord(
+                class_, None, child.find('a').text, None, None, None,
+                _extract_records(child.find('ul'))))
+            continue
+
+        id_ = child.get('id')
+        id_ = id_[id_.find('_') + 1:]
+
+        if class_ == 'gml':
+            record = YSNodeRecord(
+                class_, id_, child.find('a').text, child.find('label').text, None, None, None)
+        elif class_ == 'xwz':
+            record = YSNodeRecord(
+                class_, id_, child.find('b').text, child.find('i').text, None, None, None)
+        elif class_ == 'xlj':
+            link = child.find('a')
+            record = YSNodeRecord(class_, id_, link.text, None, link.get('href'), None, None)
+        else:
+            link = child.find('a')
+            img = child.find('img').get('src')
+            record = YSNodeRecord(
+                class_, id_, link.text, child.find('b').text,
+                link.get('data-url') or link.get('href'),
+                img[img.rfind('/') + 1: img.rfind('.')], None)
+        records.append(record)
+    return records
+
+
+def parse_listing(data) -> List[YSNodeRecord]:
+    """
+    将目录列表HTML解析为节点记录，不依赖网盘对象，可在进程池中执行
+    :param data: 列表响应体
+    """
+    return _extract_records(Fetcher.parse(data, soup=True))
 
 
 class YSFile(YSIdNode):
@@ -40,27 +101,58 @@ class YSFile(YSIdNode):
         return '{0}/fileup/js.aspx?zml={1}&wjm={2}&wjbz={3}'.format(
             self.core.up_host, web_path, filename, label or '')
 
+    @traced('upload')
     def upload(self, filepath, label=None):
-        path = self.get_path()
-        root = path.root  # type: YSMainFolder
+        root = self.main_folder  # type: YSMainFolder
         if not root.author.ok:
             raise NodeError.NOT_AUTHOR
 
+        import mimetypes
         mime, _ = mimetypes.guess_type(filepath)
-        upload_token = self.core.fetch_upload_token()
-        files = dict(file=(os.path.basename(filepath), open(filepath, 'rb'), mime))
+        upload_token = root.upload_token()
         filename = os.path.basename(filepath)
 
-        file_id = self.core.sess.post(
-            url=self._upload_uri(path.get_string(), filename, label),
-            data=dict(pz=upload_token),
-            files=files,
-            jsonify=True,
-        )['wjbh']
+        with open(filepath, 'rb') as f:
+            file_id = self.core.sess.post(
+                url=self._upload_uri(self.path_string, filename, label),
+                data=dict(pz=upload_token),
+                files=dict(file=(filename, f, mime)),
+                jsonify=True,
+            )['wjbh']
 
-        self.core.fetch_file(file_id, root)
+        root.fetch_file(file_id)
         return self
 
+    @traced('download')
+    def download(self, filepath, **kwargs):
+        """
+        下载文件到本地，设置了下载缓存时从缓存复制
+        :param filepath: 本地保存路径
+        :return: 写入的字节数
+        """
+        if not self.main_folder.rights.allow_download:
+            raise NodeError.NOT_DOWNLOADABLE
+        cache = self.core.download_cache
+        if cache is None:
+            return self.core.sess.download(self.link, filepath, **kwargs)
+        return cache.copy(self, self._downloader(**kwargs), filepath)
+
+    def _downloader(self, **kwargs):
+        return lambda path: self.core.sess.download(self.link, path, **kwargs)
+
+    @traced('download')
+    def mmap(self, **kwargs):
+        """
+        以只读内存映射读取文件内容，需设置下载缓存，未缓存时先下载
+        :return: mmap对象，空文件返回b''
+        """
+        if not self.main_folder.rights.allow_download:
+            raise NodeError.NOT_DOWNLOADABLE
+        cache = self.core.download_cache
+        if cache is None:
+            raise NodeError.NO_CACHE
+        return cache.mmap(self, self._downloader(**kwargs))
+
 
 class YSText(YSIdNode):
     """永硕文字类"""
@@ -86,8 +178,83 @@ class YSFolder(YSNode, YSQuerySet):
     """永硕目录类"""
 
     def __init__(self, **kwargs):
+        self._nodes = []  # type: List[Union[YSMainFolder, YSFolder, YSLink, YSText, YSFile]]
+        self._index = None  # type: Optional[tuple] # (建索引时的子节点列表, 精确名称索引)，按需建立
         super(YSFolder, self).__init__(type_=YSNodeType.FOLDER, **kwargs)
-        self.nodes = []  # type: List[Union[YSMainFolder, YSFolder, YSLink, YSText, YSFile]]
+
+    @property
+    def version(self):
+        """资源树版本，资源树每次变化都会递增"""
+        return self.core._version
+
+    @property
+    def nodes(self):
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes):
+        """
+        整体替换子节点（刷新）并使子节点路径缓存失效
+        子节点列表写时复制，替换后不再原地修改，读取方无需加锁
+        """
+        self._nodes = nodes
+        for node in nodes:
+            node._invalidate_path()
+
+    def _invalidate_path(self):
+        super(YSFolder, self)._invalidate_path()
+        for node in self._nodes:
+            node._invalidate_path()
+
+    def _get_index(self) -> Dict[str, list]:
+        nodes = self._nodes
+        cached = self._index
+        if cached is None or cached[0] is not nodes:
+            index = dict()
+            for node in nodes:
+                index.setdefault(node.name, []).append(node)
+            cached = self._index = (nodes, index)
+        return cached[1]
+
+    def child(self, name, type_: _Symbol = None):
+        """
+        按名称精确查找子节点
+        :param name: 节点名称
+        :param type_: 节点类型，为空时不限
+        """
+        for node in self._get_index().get(name, []):
+            if type_ is None or node.type == type_:
+                return node
+        return None
+
+    def resolve(self, path):
+        """
+        按路径精确查找节点，如 root/sub/file，每层通过名称索引查找
+        :param path: 以/分隔的节点名称
+        """
+        node = self
+        for name in path.split('/'):
+            if not name:
+                continue
+            if not isinstance(node, YSFolder):
+                return None
+            node = node.child(name)
+            if node is None:
+                return None
+        return node
+
+    def add_node(self, node):
+        """添加子节点并递增资源树版本，使搜索结果缓存失效"""
+        with self.core._tree_lock:
+            self._nodes = self._nodes + [node]
+        self.core.touch()
+
+    def remove_node(self, node):
+        with self.core._tree_lock:
+            nodes = list(self._nodes)
+            nodes.remove(node)
+            self._nodes = nodes
+        self.core.touch()
 
     def _readable_nodes(self):
         return [node.d() for node in self.nodes]
@@ -98,7 +265,7 @@ class YSFolder(YSNode, YSQuerySet):
         return dict_
 
     def add_folder(self, folder: 'YSFolder'):
-        self.nodes.append(folder)
+        self.add_node(folder)
 
 
 class YSMainFolder(YSFolder, YSIdNode):
@@ -125,94 +292,123 @@ class YSMainFolder(YSFolder, YSIdNode):
 
     def fetch_rights(self):
         """获取根目录权限"""
-        rights = self.core.sess.get(self._fetch_rights_uri(), decode=True)
+        rights = self.core.sess.get(
+            self._fetch_rights_uri(), decode=True, flight=('mlrz.aspx', 'Fhmlqx', self.id),
+            hedge=True)
         self.rights.reset(rights)
+        if self.core.store is not None:
+            self.core.store.save_rights(self)
+        self.core.touch()
         return self
 
     @staticmethod
-    def _recurrent_build_tree(parent: YSFolder, soup: Souper):
-        for child in soup.children:
-            if not isinstance(child, bs4.Tag) or not child.name == 'li':
-                continue
-
-            class_ = child.get('class')[0]
-            if class_ not in ['zml', 'gml', 'xwz', 'xlj', 'xwj']:
-                continue
-
-            exist = False
+    def _attach_records(parent: YSFolder, records: List['YSNodeRecord'], merge=False):
+        """
+        将节点记录挂到目录下，新的子节点列表在旁路构建完成后整体替换，读取方不会看到构建到一半的树
+        :param merge: 保留记录中没有的原有子节点，用于增量获取单个文件
+        """
+        with parent.core._tree_lock:
+            swaps = []
+            nodes = YSMainFolder._build_nodes(parent, records, merge, swaps)
+            for folder, children in swaps:
+                folder.nodes = children
+            parent.nodes = nodes
 
-            if class_ == 'zml':
-                name = child.find('a').text
-                query_set = parent.search_nodes(name=name)
-                if query_set.empty:
-                    resource = YSFolder(parent=parent, name=name, label=None, core=parent.core)
-                else:
-                    resource = query_set.nodes[0]
-                    exist = True
-                YSMainFolder._recurrent_build_tree(resource, soup.find('ul'))
+    @staticmethod
+    def _build_nodes(parent: YSFolder, records: List['YSNodeRecord'], merge, swaps: list):
+        """构建子节点列表，已存在的子节点保留原对象并更新属性，子目录的新列表记入swaps"""
+        existing = dict()
+        for node in parent.nodes:
+            key = (node.type, node.id) if isinstance(node, YSIdNode) else ('zml', node.name)
+            existing.setdefault(key, node)
+
+        nodes = list(parent.nodes) if merge else []
+        for record in records:
+            if record.class_ == 'zml':
+                resource = existing.get(('zml', record.name))
+                created = resource is None
+                if created:
+                    resource = YSFolder(
+                        parent=parent, name=record.name, label=None, core=parent.core)
+                swaps.append((resource, YSMainFolder._build_nodes(
+                    resource, record.children, merge, swaps)))
             else:
-                id_ = child.get('id')
-                id_ = id_[id_.find('_') + 1:]
-
-                if class_ == 'gml':
-                    label = child.find('label').text
-                    name = child.find('a').text
-                    resource = parent.get_node(id_=id_, type_=YSNodeType.FOLDER)
-                    if not resource:
-                        resource = YSMainFolder(name=name, label=label, core=parent.core, id_=id_)
-                    else:
-                        exist = True
-                elif class_ == 'xwz':
-                    name = child.find('b').text
-                    label = child.find('i').text
-                    resource = parent.get_node(id_=id_, type_=YSNodeType.TEXT)
-                    if not resource:
-                        resource = YSText(name=name, label=label, core=parent.core, id_=id_)
-                    else:
-                        exist = True
-                elif class_ == 'xlj':
-                    name = child.find('a').text
-                    link = child.find('a').get('href')
-                    resource = parent.get_node(id_=id_, type_=YSNodeType.LINK)
-                    if not resource:
-                        resource = YSLink(name=name, link=link, core=parent.core, id_=id_)
-                    else:
-                        exist = True
+                resource = existing.get((_RECORD_TYPES[record.class_], record.id))
+                created = resource is None
+                if created:
+                    resource = YSMainFolder._create_node(parent, record)
                 else:
-                    name = child.find('a').text
-                    link = child.find('a').get('data-url')
-                    if not link:
-                        link = child.find('a').get('href')
-                    label = child.find('b').text
-                    img = child.find('img').get('src')
-                    ftype = img[img.rfind('/') + 1: img.rfind('.')]
-                    resource = parent.get_node(id_=id_, type_=YSNodeType.FILE)
-                    if not resource:
-                        resource = YSFile(name=name, label=label, core=parent.core, link=link,
-                                          ftype=ftype, id_=id_)
-                    else:
-                        exist = True
-            if not exist:
-                parent.nodes.append(resource)
+                    YSMainFolder._update_node(resource, record)
+            if created or not merge:
+                nodes.append(resource)
+        return nodes
+
+    @staticmethod
+    def _update_node(node: YSIdNode, record: 'YSNodeRecord'):
+        """以最新的记录更新已存在的节点"""
+        if node.name != record.name:
+            node.name = record.name
+        if record.class_ != 'xlj':
+            node.label = record.label or ''
+        if record.class_ in ('xlj', 'xwj'):
+            node.link = record.link
+        if record.class_ == 'xwj':
+            node.ftype = record.ftype
+            if node.core.download_cache is not None:
+                node.core.download_cache.revalidate(node)
+
+    @staticmethod
+    def _create_node(parent: YSFolder, record: 'YSNodeRecord'):
+        kwargs = dict(parent=parent, name=record.name, core=parent.core, id_=record.id)
+        if record.class_ == 'gml':
+            return YSMainFolder(label=record.label, **kwargs)
+        if record.class_ == 'xwz':
+            return YSText(label=record.label, **kwargs)
+        if record.class_ == 'xlj':
+            return YSLink(link=record.link, **kwargs)
+        return YSFile(label=record.label, link=record.link, ftype=record.ftype, **kwargs)
+
+    @staticmethod
+    def _recurrent_build_tree(parent: YSFolder, soup: 'Souper'):
+        YSMainFolder._attach_records(parent, _extract_records(soup))
 
     def _fetch_nodes_uri(self):
         return '{2}/f_ht/ajcx/wj.aspx?cz=dq&mlbh={0}&_dlmc={1}&_dlmm={3}'.format(
             self.id, self.core.bucket, self.core.api_host, self.core.token)
 
+    @traced('fetch_nodes')
     def fetch_nodes(self):
         """获取子资源"""
         if not self.rights.allow_list:
             return self
 
-        soup = self.core.sess.get(self._fetch_nodes_uri(), soup=True)  # type: Souper
-        self.nodes = []
-        self._recurrent_build_tree(self, soup)
+        # 同一目录的并发刷新只请求和解析一次
+        built = self.core.sess.flight.do(('wj.aspx', 'dq', self.id), self._fetch_nodes)
+        if built is not self:
+            self.nodes = built.nodes
+        return self
+
+    def _fetch_nodes(self):
+        data = self.core.sess.get(self._fetch_nodes_uri(), decode=False, hedge=True)
+        records = self.core.parse_listing(data)
+        if self.core.store is not None:
+            self.core.store.save_listing(self, records)
+        if not self.core.store_only or self is self.core:
+            self._attach_records(self, records)
+        else:
+            self.nodes = []
+        self.core.touch()
         return self
 
-    def auth(self, password):
-        """验证密码"""
-        if self.author.auth(password):
-            self.fetch_rights()
+    @traced('auth')
+    def auth(self, password, deadline=None):
+        """
+        验证密码
+        :param deadline: 截止秒数或YSDeadline令牌
+        """
+        with YSDeadline.scope(deadline):
+            if self.author.auth(password):
+                self.fetch_rights()
         return self
 
     def _fetch_file_uri(self, file_id):
@@ -221,7 +417,12 @@ class YSMainFolder(YSFolder, YSIdNode):
 
     def fetch_file(self, file_id):
         soup = self.core.sess.get(self._fetch_file_uri(file_id), soup=True)
-        self._recurrent_build_tree(self, soup)
+        records = _extract_records(soup)
+        if self.core.store is not None:
+            self.core.store.save_listing(self, records, replace=False)
+        if not self.core.store_only:
+            self._attach_records(self, records, merge=True)
+        self.core.touch()
         return self
 
     def _modify_uri(self):
@@ -241,6 +442,7 @@ class YSMainFolder(YSFolder, YSIdNode):
             sm=self.label,
             kqmm=self.author.password
         ))
+        self.core.touch()
         return self
 
     def _add_uri(self):
@@ -257,7 +459,7 @@ class YSMainFolder(YSFolder, YSIdNode):
             kqmm=self.author.password
         ))
 
-        self.parent.nodes.append(self)
+        self.parent.add_node(self)
         return self
 
     def _delete_uri(self):
@@ -269,16 +471,15 @@ class YSMainFolder(YSFolder, YSIdNode):
             raise NodeError.NOT_AUTHOR
 
         self.core.sess.get(self._delete_uri())
-        self.parent.nodes.remove(self)
+        self.parent.remove_node(self)
 
     def _upload_token_uri(self):
         return '{0}/f_ht/ajcx/wj.aspx?cz=dq&mlbh={1}&_dlmc={2}&_dlmm={3}'.format(
             self.core.api_host, self.id, self.core.bucket, self.core.token)
 
     def upload_token(self):
-        data = self.core.sess.get(self._upload_token_uri(), decode=True)
-        matcher = re.search("scpz = '(.*?)'", data)
-        return matcher.group(1) if matcher else None
+        data = self.core.sess.get(self._upload_token_uri(), raw=True)
+        return scan_group(data, rb"scpz = '(.*?)'")
 
 
 class YS(YSMainFolder):
@@ -287,49 +488,112 @@ class YS(YSMainFolder):
 
     """永硕类"""
 
-    def __init__(self, bucket, password=None, entrance=None):
+    def __init__(self, bucket, password=None, entrance=None, transport: Transport = None,
+                 max_requests=None, parser_pool=None, query_memo_size=256, store=None,
+                 store_only=False, cassette=None, hedge=None, download_cache=None):
         """
         :param bucket: 永硕空间ID
         :param password: 管理员密码
         :param entrance: 空间进入密码
+        :param transport: 共享的传输层，为空时独占一个
+        :param max_requests: 该空间同时进行的请求数上限
+        :param parser_pool: 解析目录列表的进程池（如ProcessPoolExecutor），为空时在当前线程解析
+        :param query_memo_size: 搜索结果缓存的条目数，为0时不缓存
+        :param store: 节点存储（如YSNodeStore），获取的节点会同时写入存储
+        :param store_only: 根目录的子节点只写入存储，不在内存中建树
+        :param cassette: 请求录像（YSCassette），用于离线回放真实数据
+        :param hedge: 目录列表与权限请求的对冲延迟分位数（如0.95），为空时不对冲
+        :param download_cache: 文件下载磁盘缓存（YSDownloadCache），可在多个空间之间共享
         """
         self.bucket = bucket
-
-        self.sess = Fetcher()
+        self.parser_pool = parser_pool
+        self.store = store
+        self.store_only = store_only and store is not None
+        self.download_cache = download_cache
+
+        self._versions = itertools.count(1)
+        self._version = 0  # 资源树版本
+        self.query_memo = _LRUCache(query_memo_size) if query_memo_size else None
+
+        self._tree_lock = threading.RLock()  # 资源树写入锁，读取不加锁
+        self._reset_lock = threading.Lock()
+        self.sess = Fetcher(
+            transport=transport, max_requests=max_requests, cassette=cassette, hedge=hedge)
         self.token = ''  # API访问口令
         self.info = YSZoneInfo(client=self)
 
-        super(YS, self).__init__(label=None, id_=None, name=None, core=self)
+        super(YS, self).__init__(parent=None, label=None, id_=None, name=None, core=self)
 
         self.author = YSAdminLocker(client=self)  # 管理员认证器
-        if password:
-            self.author.auth(password)
+        self.accessor = None  # type: Optional[YSEntranceLocker] # 访问认证器
 
-        self.accessor = YSEntranceLocker(client=self)  # 访问认证器
-        if entrance:
-            self.accessor.auth(entrance)
-
-        self._upload_file_count = 0
+        self._upload_counter = itertools.count()
         self.root = self
 
-    def reset(self):
-        self.sess.reset()
-        self.token = ''
+        self.bootstrap(password, entrance)
+
+    @traced('bootstrap')
+    def bootstrap(self, password=None, entrance=None):
+        """
+        建立客户端：主页只获取和解析一次，供访问认证器与空间信息共用
+        管理员认证的请求携带主页下发的口令和Cookie，须在主页获取和进入认证完成后进行，
+        仅与空间信息的解析并行
+        :param password: 管理员密码，为空时沿用已有密码
+        :param entrance: 空间进入密码，为空时沿用已有密码
+        """
+        if password:
+            self.author.password = password
+
+        # 重置时在新的访问认证器上登录，完成后整体替换，其他线程不会看到未认证的中间状态
+        page = self.sess.get(self.host, raw=True)
+        accessor = YSEntranceLocker(client=self, page=page)
+        entrance = entrance or (self.accessor.password if self.accessor else '')
+        if entrance and not accessor.ok:
+            page = accessor.login(entrance)
+        accessor.password = entrance or ''
+        self.accessor = accessor
+
+        admin = self.sess.transport.submit(self.author.reset) if self.author.password else None
+        self.info.fetch_info(page)
+        if admin:
+            admin.result()
+        return self
 
-        self.accessor.reset()
-        self.author.reset()
-        self.info.reset()
+    def reset(self):
+        """重建会话并重新认证，进行中的请求继续使用旧会话，新口令就绪前沿用旧口令"""
+        with self._reset_lock:
+            self.sess.reset()
+            self.bootstrap()
+            if not self.accessor.ok:
+                self.token = ''
+            self.info.fetch_comments()
 
-        self.upload_file_count = 0
+            self.upload_file_count = 0
 
     @property
     def upload_file_count(self):
-        self._upload_file_count += 1
-        return self._upload_file_count - 1
+        """每次读取返回当前计数并自增，多线程下不会重复"""
+        return next(self._upload_counter)
 
     @upload_file_count.setter
     def upload_file_count(self, v):
-        self._upload_file_count = v
+        self._upload_counter = itertools.count(v)
+
+    def touch(self):
+        """资源树发生变化，递增版本使搜索结果缓存失效"""
+        self._version = next(self._versions)
+        return self
+
+    def query(self, **kwargs):
+        """在节点存储中查询，参数见YSNodeStore.query"""
+        return self.store.query(self, **kwargs)
+
+    def parse_listing(self, data) -> List[YSNodeRecord]:
+        """解析目录列表，设置了进程池时交由子进程解析，主进程只负责挂载节点"""
+        if self.parser_pool is None:
+            return parse_listing(data)
+        with tracer.span('parse', pool=True):
+            return self.parser_pool.submit(parse_listing, bytes(data)).result()
 
     @property
     def host(self):
@@ -342,22 +606,53 @@ class YS(YSMainFolder):
         return '{1}/f_ht/ajcx/ml.aspx?cz=ml_dq&_dlmc={0}&_dlmm={2}'.format(
             self.bucket, self.api_host, self.token)
 
+    @traced('fetch_nodes')
     def fetch_nodes(self):
         if not self.accessor.ok:
             raise NodeError.INACCESSIBLE
 
-        soup = self.sess.get(self._fetch_nodes_uri(), soup=True)  # type: Souper
-        self.nodes = []
-        self._recurrent_build_tree(self, soup)
+        self.sess.flight.do(('ml.aspx', 'ml_dq'), self._fetch_nodes)
         return self
 
-    def fetch_tree(self):
-        """获取整个资源树"""
-        self.fetch_nodes()
-        for node in self.nodes:
-            node.fetch_nodes()
+    @traced('fetch_tree')
+    def fetch_tree(self, deadline=None):
+        """
+        获取整个资源树，各根目录通过传输层线程池并行获取，在传输层线程池的任务中调用时使用嵌套线程池
+        :param deadline: 截止秒数或YSDeadline令牌，到期后放弃尚未完成的目录
+        """
+        with YSDeadline.scope(deadline):
+            self.fetch_nodes()
+            self.sess.transport.map(lambda node: node.fetch_nodes(), list(self.nodes))
         return self
 
+    def walk(self, prefetch=None, deadline=None):
+        """
+        类似os.walk自上而下遍历资源树，每个根目录的列表解析完成后立即产出(目录, 子节点列表)
+        根目录在后台并行预取，按完成顺序产出，消费方处理慢时暂停预取
+        :param prefetch: 同时预取的根目录数，默认为传输层线程池大小
+        :param deadline: 截止秒数或YSDeadline令牌，到期后停止遍历并抛出DeadlineError
+        """
+        # 生成器在多次产出之间挂起，令牌只在获取时生效，不留在调用方线程
+        deadline = YSDeadline.of(deadline) or YSDeadline.current()
+
+        def fetch(folder: YSMainFolder):
+            with YSDeadline.scope(deadline):
+                return folder.fetch_nodes()
+
+        fetch(self)
+        yield self, list(self.nodes)
+
+        folders = [node for node in self.nodes if isinstance(node, YSMainFolder)]
+        for folder in self.sess.transport.stream(fetch, folders, prefetch):
+            stack = [folder]  # type: List[YSFolder]
+            while stack:
+                current = stack.pop()
+                children = list(current.nodes)
+                yield current, children
+                stack.extend(reversed([node for node in children if isinstance(node, YSFolder)]))
+
+    iter_tree = walk
+
     def _readable_info(self):
         return self.info.d()
 
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .base import Transport
+from .node import YS
+
+
+class _PoolEntry:
+    def __init__(self, client: YS, password, entrance):
+        self.client = client
+        self.password = password
+        self.entrance = entrance
+        self.leases = 0  # 正在使用该客户端的调用数
+        self.last_used = time.monotonic()
+
+
+class YSPool:
+    """
+    多空间客户端池，各空间Cookie与口令独立，连接池和线程池共享
+    共享线程池的任务中调用fetch_tree、walk等再次并行的方法时，嵌套任务提交到传输层的嵌套线程池，
+    不占用共享线程池，因此可以通过transport.map并行获取多个空间的资源树，空间数多于workers也不会死锁；
+    更深一层的嵌套在当前线程中顺序执行。自行向transport.executor提交并等待其他共享线程池任务的代码不受此保护
+    """
+
+    def __init__(self, max_clients=128, idle_timeout=None, max_requests=32, max_bucket_requests=4,
+                 workers=16, transport: Transport = None, parser_pool=None):
+        """
+        :param max_clients: 最多保留的客户端数，超出时按最近最少使用淘汰空闲客户端
+        :param idle_timeout: 空闲超过该秒数的客户端会被淘汰，None表示不按时间淘汰
+        :param max_requests: 全局同时进行的请求数上限
+        :param max_bucket_requests: 单个空间同时进行的请求数上限
+        :param workers: 共享线程池大小
+        :param transport: 自定义的共享传输层
+        :param parser_pool: 各空间共享的目录列表解析进程池
+        """
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.max_bucket_requests = max_bucket_requests
+        self.parser_pool = parser_pool
+        self.transport = transport or Transport(
+            pool_maxsize=max_requests or 10, workers=workers, max_requests=max_requests)
+
+        self._entries = OrderedDict()  # type: OrderedDict[str, _PoolEntry]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, bucket):
+        return bucket in self._entries
+
+    def _create(self, bucket, password, entrance):
+        return YS(bucket, password=password, entrance=entrance,
+                  transport=self.transport, max_requests=self.max_bucket_requests,
+                  parser_pool=self.parser_pool)
+
+    def _acquire(self, bucket, password, entrance, lease):
+        with self._lock:
+            entry = self._entries.get(bucket)
+            if entry and (entry.password, entry.entrance) == (password, entrance):
+                self._entries.move_to_end(bucket)
+                entry.last_used = time.monotonic()
+                entry.leases += lease
+                return entry
+
+        # 建立客户端需要网络请求，不在锁内进行
+        entry = _PoolEntry(self._create(bucket, password, entrance), password, entrance)
+        with self._lock:
+            current = self._entries.get(bucket)
+            if current and (current.password, current.entrance) == (password, entrance):
+                entry = current  # 并发创建时保留先入池的客户端
+            else:
+                self._entries[bucket] = entry
+            self._entries.move_to_end(bucket)
+            entry.last_used = time.monotonic()
+            entry.leases += lease
+            self._evict()
+        return entry
+
+    def get(self, bucket, password=None, entrance=None) -> YS:
+        """
+        获取空间客户端，不存在时创建
+        :param bucket: 永硕空间ID
+        :param password: 管理员密码
+        :param entrance: 空间进入密码
+        """
+        return self._acquire(bucket, password, entrance, lease=0).client
+
+    @contextmanager
+    def lease(self, bucket, password=None, entrance=None):
+        """在使用期间锁定客户端，避免被淘汰"""
+        entry = self._acquire(bucket, password, entrance, lease=1)
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                entry.last_used = time.monotonic()
+
+    def _evict(self):
+        """按最近最少使用顺序淘汰空闲客户端，调用方需持有锁，最近使用的客户端总会保留"""
+        now = time.monotonic()
+        for bucket, entry in list(self._entries.items())[:-1]:
+            if entry.leases:
+                continue
+            expired = self.idle_timeout is not None and now - entry.last_used > self.idle_timeout
+            if expired or len(self._entries) > self.max_clients:
+                del self._entries[bucket]
+
+    def evict(self):
+        """主动淘汰过期与超额的空闲客户端"""
+        with self._lock:
+            self._evict()
+        return self
+
+    def discard(self, bucket):
+        with self._lock:
+            self._entries.pop(bucket, None)
+        return self
+
+    def metrics(self):
+        """客户端池与共享传输层的指标"""
+        metrics = self.transport.metrics()
+        with self._lock:
+            metrics.update(clients=len(self._entries),
+                           leased=sum(1 for entry in self._entries.values() if entry.leases))
+        return metrics
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+        self.transport.close()
@@ -0,0 +1,325 @@
+import sqlite3
+import threading
+from typing import Iterator, List, Optional, Union
+
+from smartify import E
+
+from .base import _Symbol
+from .modules import YSNodeType, YSNode
+from .node import YS, YSMainFolder, YSFolder, YSFile, YSText, YSLink, YSNodeRecord, _RECORD_TYPES
+
+
+@E.register()
+class StoreError:
+    BAD_ORDER = E("不支持的排序字段")
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS nodes (
+    rowid INTEGER PRIMARY KEY,
+    bucket TEXT NOT NULL,
+    node_id TEXT,
+    parent INTEGER,
+    root INTEGER,
+    type TEXT NOT NULL,
+    main INTEGER NOT NULL DEFAULT 0,
+    name TEXT,
+    label TEXT,
+    link TEXT,
+    ftype TEXT,
+    rights TEXT,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_nodes_parent ON nodes(parent);
+CREATE INDEX IF NOT EXISTS idx_nodes_root ON nodes(root);
+CREATE INDEX IF NOT EXISTS idx_nodes_type ON nodes(bucket, type);
+CREATE INDEX IF NOT EXISTS idx_nodes_name ON nodes(bucket, name);
+CREATE INDEX IF NOT EXISTS idx_nodes_ftype ON nodes(bucket, ftype);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_nodes_id ON nodes(bucket, type, node_id)
+    WHERE node_id IS NOT NULL;
+'''
+
+_TYPE_NAMES = {
+    YSNodeType.FILE: 'FILE', YSNodeType.FOLDER: 'FOLDER',
+    YSNodeType.TEXT: 'TEXT', YSNodeType.LINK: 'LINK',
+}
+_NAME_TYPES = {name: type_ for type_, name in _TYPE_NAMES.items()}
+
+_ORDERS = ('name', 'label', 'ftype', 'type', 'path', 'rowid')
+
+
+class YSNodeStore:
+    """SQLite节点存储，按需把节点写入数据表，查询时再逐个构造节点对象"""
+
+    def __init__(self, path=':memory:'):
+        """
+        :param path: 数据库文件路径
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _main_row(self, bucket, folder: YSMainFolder, create=True) -> Optional[int]:
+        row = self._conn.execute(
+            'SELECT rowid FROM nodes WHERE bucket=? AND type=? AND node_id=?',
+            (bucket, 'FOLDER', folder.id)).fetchone()
+        if row:
+            return row[0]
+        if not create:
+            return None
+        cursor = self._conn.execute(
+            'INSERT INTO nodes (bucket, node_id, type, main, name, label, rights, path) '
+            'VALUES (?, ?, ?, 1, ?, ?, ?, ?)',
+            (bucket, folder.id, 'FOLDER', folder.name, folder.label,
+             folder.rights.to_string(), ''))
+        self._conn.execute('UPDATE nodes SET root=rowid WHERE rowid=?', (cursor.lastrowid,))
+        return cursor.lastrowid
+
+    def _save_roots(self, bucket, records: List[YSNodeRecord], replace):
+        ids = []
+        for record in records:
+            if record.class_ != 'gml':
+                continue
+            ids.append(record.id)
+            cursor = self._conn.execute(
+                'UPDATE nodes SET name=?, label=? WHERE bucket=? AND type=? AND node_id=?',
+                (record.name, record.label, bucket, 'FOLDER', record.id))
+            if not cursor.rowcount:
+                cursor = self._conn.execute(
+                    'INSERT INTO nodes (bucket, node_id, type, main, name, label, path) '
+                    'VALUES (?, ?, ?, 1, ?, ?, ?)',
+                    (bucket, record.id, 'FOLDER', record.name, record.label, ''))
+                self._conn.execute(
+                    'UPDATE nodes SET root=rowid WHERE rowid=?', (cursor.lastrowid,))
+
+        if replace:
+            # 不再出现在根列表中的根目录连同其子节点一并删除
+            placeholders = ','.join('?' * len(ids))
+            self._conn.execute(
+                'DELETE FROM nodes WHERE bucket=? AND root IN (SELECT rowid FROM nodes '
+                'WHERE bucket=? AND main=1 AND node_id NOT IN ({0}))'.format(placeholders),
+                (bucket, bucket, *ids))
+
+    def _insert(self, bucket, root, parent, prefix, records: List[YSNodeRecord], replace):
+        rows = []
+        for record in records:
+            path = '{0}/{1}'.format(prefix, record.name) if prefix else record.name
+            if record.class_ == 'zml':
+                row = None
+                if not replace:
+                    row = self._conn.execute(
+                        'SELECT rowid FROM nodes WHERE parent=? AND type=? AND node_id IS NULL '
+                        'AND name=?', (parent, 'FOLDER', record.name)).fetchone()
+                if row:
+                    rowid = row[0]
+                else:
+                    rowid = self._conn.execute(
+                        'INSERT INTO nodes (bucket, parent, root, type, name, path) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (bucket, parent, root, 'FOLDER', record.name, path)).lastrowid
+                self._insert(bucket, root, rowid, path, record.children, replace)
+            else:
+                rows.append((bucket, record.id, parent, root,
+                             _TYPE_NAMES[_RECORD_TYPES[record.class_]],
+                             record.name, record.label, record.link, record.ftype, path))
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO nodes '
+            '(bucket, node_id, parent, root, type, name, label, link, ftype, path) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def save_listing(self, folder: Union[YS, YSMainFolder], records: List[YSNodeRecord],
+                     replace=True):
+        """
+        写入一个目录的列表记录
+        :param folder: 列表所属的网盘或根目录
+        :param records: 节点记录
+        :param replace: 是否先删除该目录原有的子节点
+        """
+        bucket = folder.core.bucket
+        with self._lock, self._conn:
+            if folder is folder.core:
+                self._save_roots(bucket, records, replace)
+                return self
+            root = self._main_row(bucket, folder)
+            if replace:
+                self._conn.execute('DELETE FROM nodes WHERE root=? AND rowid!=?', (root, root))
+            self._insert(bucket, root, root, '', records, replace)
+        return self
+
+    def save_rights(self, folder: YSMainFolder):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE nodes SET rights=? WHERE rowid=?',
+                (folder.rights.to_string(), self._main_row(folder.core.bucket, folder)))
+        return self
+
+    def save_tree(self, core: YS):
+        """将内存中的整个资源树写入存储"""
+        def to_records(folder: YSFolder):
+            records = []
+            for node in folder.nodes:
+                if isinstance(node, YSMainFolder):
+                    records.append(YSNodeRecord(
+                        'gml', node.id, node.name, node.label, None, None, None))
+                elif isinstance(node, YSFolder):
+                    records.append(YSNodeRecord(
+                        'zml', None, node.name, None, None, None, to_records(node)))
+                elif isinstance(node, YSFile):
+                    records.append(YSNodeRecord(
+                        'xwj', node.id, node.name, node.label, node.link, node.ftype, None))
+                elif isinstance(node, YSLink):
+                    records.append(YSNodeRecord(
+                        'xlj', node.id, node.name, None, node.link, None, None))
+                elif isinstance(node, YSText):
+                    records.append(YSNodeRecord(
+                        'xwz', node.id, node.name, node.label, None, None, None))
+            return records
+
+        self.save_listing(core, to_records(core))
+        for folder in core.nodes:
+            if isinstance(folder, YSMainFolder):
+                self.save_listing(folder, to_records(folder))
+                self.save_rights(folder)
+        return self
+
+    def _materialize(self, core: YS, row, folders: dict) -> YSNode:
+        """由数据行构造节点，父目录按需构造并在一次查询内复用"""
+        type_ = _NAME_TYPES[row['type']]
+        if row['main']:
+            folder = core.get_folder(row['node_id'])
+            if folder is None:
+                folder = YSMainFolder(
+                    parent=core, name=row['name'], label=row['label'], core=core,
+                    id_=row['node_id'])
+                if row['rights']:
+                    folder.rights.reset(row['rights'])
+            folder._store_key = row['rowid']
+            return folder
+
+        parent = self._folder(core, row['parent'], folders)
+        kwargs = dict(parent=parent, name=row['name'], core=core)
+        if type_ == YSNodeType.FOLDER:
+            node = YSFolder(label=None, **kwargs)
+        elif type_ == YSNodeType.FILE:
+            node = YSFile(label=row['label'], link=row['link'], ftype=row['ftype'],
+                          id_=row['node_id'], **kwargs)
+        elif type_ == YSNodeType.LINK:
+            node = YSLink(link=row['link'], id_=row['node_id'], **kwargs)
+        else:
+            node = YSText(label=row['label'], id_=row['node_id'], **kwargs)
+        node._store_key = row['rowid']
+        return node
+
+    def _folder(self, core: YS, rowid, folders: dict) -> YSFolder:
+        if rowid not in folders:
+            with self._lock:
+                row = self._conn.execute('SELECT * FROM nodes WHERE rowid=?', (rowid,)).fetchone()
+            folders[rowid] = self._materialize(core, row, folders)
+        return folders[rowid]
+
+    def _key(self, core: YS, node: YSNode) -> Optional[int]:
+        key = getattr(node, '_store_key', None)
+        if key is None and isinstance(node, YSMainFolder):
+            with self._lock:
+                key = self._main_row(core.bucket, node, create=False)
+        return key
+
+    def _where(self, core: YS, types=None, name=None, name_like=None, label_like=None, ftype=None,
+               parent: YSFolder = None, root: YSMainFolder = None):
+        where, params = ['bucket=?'], [core.bucket]
+        if types:
+            if isinstance(types, _Symbol):
+                types = [types]
+            where.append('type IN ({0})'.format(','.join('?' * len(types))))
+            params.extend(_TYPE_NAMES[type_] for type_ in types)
+        if name is not None:
+            where.append('name=?')
+            params.append(name)
+        if name_like is not None:
+            where.append('instr(name, ?) > 0')
+            params.append(name_like)
+        if label_like is not None:
+            where.append('instr(label, ?) > 0')
+            params.append(label_like)
+        if ftype is not None:
+            where.append('ftype=?')
+            params.append(ftype)
+        if parent is not None:
+            where.append('parent=?')
+            params.append(self._key(core, parent))
+        if root is not None:
+            where.append('root=? AND rowid!=root')
+            params.append(self._key(core, root))
+        return ' AND '.join(where), params
+
+    def query(self, core: YS, order_by='rowid', descending=False, limit=None, offset=0,
+              **filters) -> Iterator[YSNode]:
+        """
+        查询节点，逐行构造并返回节点对象
+        :param core: 节点所属的网盘
+        :param order_by: 排序字段
+        :param descending: 是否降序
+        :param limit: 最大返回数
+        :param offset: 跳过的条目数
+        :param filters: 过滤条件，包括types、name（精确）、name_like、label_like、ftype、
+            parent（直接父目录）和root（所属根目录，包含所有层级）
+        """
+        if order_by not in _ORDERS:
+            raise StoreError.BAD_ORDER(debug_message=order_by)
+
+        where, params = self._where(core, **filters)
+        sql = 'SELECT * FROM nodes WHERE {0} ORDER BY {1} {2} LIMIT ? OFFSET ?'.format(
+            where, order_by, 'DESC' if descending else 'ASC')
+        params.extend((-1 if limit is None else limit, offset))
+
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+
+        folders = dict()
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(256)
+            if not rows:
+                break
+            for row in rows:
+                yield self._materialize(core, row, folders)
+
+    def count(self, core: YS, **filters) -> int:
+        where, params = self._where(core, **filters)
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM nodes WHERE {0}'.format(where), params).fetchone()[0]
+
+    def count_by_ftype(self, core: YS):
+        """按文件类型统计文件数，按数量降序"""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                'SELECT ftype, COUNT(*) AS n FROM nodes WHERE bucket=? AND type=? '
+                'GROUP BY ftype ORDER BY n DESC', (core.bucket, 'FILE'))]
+
+    def largest_folders(self, core: YS, limit=10, recursive=True):
+        """
+        文件最多的目录
+        :param recursive: 为真时按根目录统计所有层级的文件，否则按直接父目录统计
+        :return: [(节点, 文件数)]
+        """
+        column = 'root' if recursive else 'parent'
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT {0} AS folder, COUNT(*) AS n FROM nodes WHERE bucket=? AND type=? '
+                'GROUP BY {0} ORDER BY n DESC LIMIT ?'.format(column),
+                (core.bucket, 'FILE', limit)).fetchall()
+        folders = dict()
+        return [(self._folder(core, row['folder'], folders), row['n']) for row in rows]
+
+    def execute(self, sql, params=()):
+        """执行自定义只读查询，返回数据行"""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
@@ -0,0 +1,80 @@
+"""
+导入耗时基准
+
+使用 python -X importtime 统计各入口的导入耗时，并检查重量级依赖没有被提前加载。
+用法: python benchmarks/bench_import.py [--budget-ms 30] [--repeat 5] [--top 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 入口语句 -> 不应在导入阶段加载的模块
+CASES = [
+    ('import YongShuoX', ['bs4', 'requests', 'smartify', 'mimetypes']),
+    ('from YongShuoX import YS', ['bs4', 'requests', 'mimetypes']),
+]
+
+
+def import_time(statement, startup=()):
+    """
+    运行一次 -X importtime
+    :param startup: 解释器启动时本就会加载的模块，不计入总耗时
+    :return: (总耗时微秒, {模块名: 累计耗时微秒})
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True,
+        check=True)
+
+    modules = dict()
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        modules[name.strip()] = int(cumulative_us)
+        # 累加入口语句触发的所有顶层模块，包括 YongShuoX 首次引入的第三方依赖
+        if len(name) - len(name.lstrip()) == 1 and name.strip() not in startup:
+            total += int(cumulative_us)
+    return total, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='YongShuoX 导入耗时基准')
+    parser.add_argument('--budget-ms', type=float, default=None, help='import YongShuoX 的耗时上限')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最小值')
+    parser.add_argument('--top', type=int, default=10, help='展示最慢的模块数')
+    args = parser.parse_args(argv)
+
+    # 解释器启动时本就会加载的模块不计入展示
+    _, startup = import_time('pass')
+    startup = set(startup)
+
+    failed = False
+    for statement, forbidden in CASES:
+        runs = [import_time(statement, startup) for _ in range(max(args.repeat, 1))]
+        best, modules = min(runs, key=lambda run: run[0])
+
+        print('{0}: {1:.2f} ms'.format(statement, best / 1000))
+        loaded_after_startup = [(name, us) for name, us in modules.items() if name not in startup]
+        slowest = sorted(loaded_after_startup, key=lambda item: item[1], reverse=True)[:args.top]
+        for name, us in slowest:
+            print('    {0:>10.2f} ms  {1}'.format(us / 1000, name))
+
+        loaded = [name for name in forbidden if name in modules]
+        if loaded:
+            failed = True
+            print('  ! 提前加载了: {0}'.format(', '.join(loaded)))
+
+        if args.budget_ms is not None and statement == CASES[0][0] and best / 1000 > args.budget_ms:
+            failed = True
+            print('  ! 超出预算 {0} ms'.format(args.budget_ms))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+自适应并发限制器基准
+
+在本地启动一个模拟 ys168 的服务器，随并发升高注入延迟和 503，观察限制器的并发变化。
+用法: python benchmarks/bench_limiter.py [--requests 400] [--threads 32] [--capacity 8] [--check]
+--check 时断言自适应模式下服务器没有返回 503，且限制器的并发与服务器的并发峰值不超过两倍容量，失败时退出码为 1
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from YongShuoX.base import Fetcher, Transport  # noqa: E402
+
+
+class StandInServer(ThreadingHTTPServer):
+    """超过容量后延迟线性增加，超过两倍容量时返回 503"""
+    daemon_threads = True
+
+    def __init__(self, capacity, base_latency):
+        super(StandInServer, self).__init__(('127.0.0.1', 0), StandInHandler)
+        self.capacity = capacity
+        self.base_latency = base_latency
+        self.active = 0
+        self.peak = 0  # 并发峰值
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server  # type: StandInServer
+        with server.lock:
+            server.active += 1
+            active = server.active
+            server.peak = max(server.peak, active)
+        try:
+            if active > server.capacity * 2:
+                with server.lock:
+                    server.rejected += 1
+                self.send_response(503)
+                self.end_headers()
+                return
+            overload = max(0, active - server.capacity)
+            time.sleep(server.base_latency * (1 + overload))
+            body = b'<ul><li class="xwz" id="x_1"><b>ok</b><i></i></li></ul>'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='自适应并发限制器基准')
+    parser.add_argument('--requests', type=int, default=400, help='总请求数')
+    parser.add_argument('--threads', type=int, default=32, help='客户端线程数')
+    parser.add_argument('--capacity', type=int, default=8, help='模拟服务器的最佳并发')
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟服务器的基础延迟')
+    parser.add_argument('--fixed', action='store_true', help='关闭自适应限制作为对照')
+    parser.add_argument('--check', action='store_true', help='断言没有 503 且并发不超过两倍容量')
+    args = parser.parse_args(argv)
+
+    server = StandInServer(args.capacity, args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{0}/f_ht/ajcx/wj.aspx'.format(server.server_address[1])
+    host = '127.0.0.1:{0}'.format(server.server_address[1])
+
+    transport = Transport(pool_maxsize=args.threads, workers=args.threads, adaptive=not args.fixed)
+    fetcher = Fetcher(transport=transport)
+    stop = threading.Event()
+    peak = [0]  # 限制器并发的峰值
+
+    def sample():
+        ticks = 0
+        while not stop.wait(0.01):
+            limiter = transport.metrics()['hosts'].get(host)
+            if not limiter:
+                continue
+            peak[0] = max(peak[0], limiter['concurrency'])
+            ticks += 1
+            if ticks % 50 == 0:
+                print('  并发 {concurrency:>3}  进行中 {inflight:>3}  请求 {requests:>5}  错误 {errors:>4}'
+                      .format(**limiter))
+
+    threading.Thread(target=sample, daemon=True).start()
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(lambda _: fetcher.get(url), range(args.requests)))
+    seconds = time.time() - start
+    stop.set()
+
+    print('{0} 个请求耗时 {1:.2f} 秒，{2:.1f} 次/秒，服务器拒绝 {3} 次'.format(
+        args.requests, seconds, args.requests / seconds, server.rejected))
+    print('限制器并发峰值 {0}，服务器并发峰值 {1}'.format(peak[0], server.peak))
+    print(transport.metrics())
+    server.shutdown()
+    transport.close()
+
+    if not args.check:
+        return 0
+    errors = []
+    if args.fixed:
+        errors.append('--check 只适用于自适应模式')
+    if server.rejected:
+        errors.append('服务器返回了 {0} 次 503'.format(server.rejected))
+    if max(peak[0], server.peak) > args.capacity * 2:
+        errors.append('并发峰值超过两倍容量 {0}'.format(args.capacity * 2))
+    for error in errors:
+        print('  ! {0}'.format(error))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
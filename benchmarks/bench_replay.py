@@ -0,0 +1,75 @@
+"""
+离线回放基准
+
+先在线录制一次真实空间的请求，之后回放录像，单独测量解析与建树的耗时。
+录制: python benchmarks/bench_replay.py BUCKET replay.jsonl.gz --record [--password PWD]
+回放: python benchmarks/bench_replay.py BUCKET replay.jsonl.gz [--repeat 20] [--profile]
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from YongShuoX import YS, YSCassette, tracer  # noqa: E402
+
+
+def run(bucket, cassette, password, entrance):
+    client = YS(bucket, password=password, entrance=entrance, cassette=cassette)
+    client.fetch_tree()
+    client.info.fetch_comments()
+    return client
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线回放基准')
+    parser.add_argument('bucket', help='永硕空间ID')
+    parser.add_argument('cassette', help='录像文件路径')
+    parser.add_argument('--record', action='store_true', help='在线录制而不是回放')
+    parser.add_argument('--password', help='管理员密码，回放时密码已脱敏，填写任意值即可')
+    parser.add_argument('--entrance', help='空间进入密码，回放时同上')
+    parser.add_argument('--repeat', type=int, default=10, help='回放次数')
+    parser.add_argument('--profile', action='store_true', help='使用cProfile输出热点函数')
+    parser.add_argument('--top', type=int, default=20, help='输出的热点函数数')
+    args = parser.parse_args(argv)
+
+    if args.record:
+        run(args.bucket, YSCassette(args.cassette, mode=YSCassette.RECORD),
+            args.password, args.entrance)
+        print('已录制到 {0}，{1} 字节'.format(args.cassette, os.path.getsize(args.cassette)))
+        return
+
+    totals = defaultdict(lambda: [0, 0.0])
+
+    def collect(span):
+        totals[span.name][0] += 1
+        totals[span.name][1] += span.duration
+
+    tracer.add_hook(collect).enable()
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        cassette = YSCassette(args.cassette)
+        if profiler:
+            profiler.enable()
+        run(args.bucket, cassette, args.password, args.entrance)
+        if profiler:
+            profiler.disable()
+    seconds = time.perf_counter() - start
+    tracer.disable().remove_hook(collect)
+
+    print('回放 {0} 次耗时 {1:.3f} 秒，每次 {2:.2f} 毫秒'.format(
+        args.repeat, seconds, seconds / args.repeat * 1000))
+    for name, (count, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        print('  {0:<16} {1:>6} 次  {2:>9.2f} 毫秒'.format(name, count, total * 1000))
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,4 +16,9 @@ setup(
         'beautifulsoup4',
         'requests', 'smartify'
     ],
+    entry_points={
+        'console_scripts': [
+            'ysmirror=YongShuoX.mirror:main',
+        ],
+    },
 )